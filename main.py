@@ -997,6 +997,24 @@ if menu_option == "📊 Overview":
             ])
             st.dataframe(tax_payment_df, hide_index=True, use_container_width=True)
 
+        field_confidence = extracted_json.get('field_confidence', {})
+        field_source = extracted_json.get('field_source', {})
+        source_labels = {"table": "Textract table", "kv": "Textract key-value", "llm": "LLM"}
+        if field_confidence:
+            with st.expander("🎯 Extraction Confidence"):
+                confidence_df = pd.DataFrame([
+                    {
+                        "Section": section.replace('_', ' ').title(),
+                        "Field": field.replace('_', ' ').title(),
+                        "Source": source_labels.get(field_source.get(section, {}).get(field), "Unknown"),
+                        "Confidence": "" if confidence is None else f"{confidence:.1f}%",
+                    }
+                    for section, fields in field_confidence.items()
+                    for field, confidence in fields.items()
+                    if extracted_json.get(section, {}).get(field) is not None
+                ])
+                st.dataframe(confidence_df, hide_index=True, use_container_width=True)
+
 
         # with st.expander("📋 Schedule Information"):
         #     tab1, tab2, tab3 = st.tabs(["Schedule A", "Schedule D", "Schedule 1"])
@@ -1,10 +1,15 @@
 import boto3
-import time
 import json
 import os
-from src import config
+import numpy as np
+from src import block_archive, config, pdf_text_layer, textract_cache, textract_jobs
+from src.block_store import BlockStore
+from src.line_grouping import DEFAULT_LINE_TOLERANCE, adaptive_line_tolerance, group_line_indexes
+from src.sectioning import page_at, page_marker_index
+from src.textract_jobs import TextractJobOrchestrator
 from dotenv import load_dotenv
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 import re
 
 upload_dir_path=config.PATHS.get("upload_dir_path","")
@@ -15,8 +20,55 @@ aws_access_key = os.getenv("AWS_ACCESS_KEY_ID")
 aws_secret_key = os.getenv("AWS_SECRET_ACCESS_KEY")
 aws_region = os.getenv("AWS_REGION")
 
+# Common schedule patterns
+MAIN_SCHEDULE_PATTERNS = {
+    'A': r'SCHEDULE A\s*\([^)]*\)',
+    'B': r'SCHEDULE B\s*\([^)]*\)',
+    'C': r'SCHEDULE C\s*\([^)]*\)',
+    'D': r'SCHEDULE D\s*\([^)]*\)',
+    'E': r'SCHEDULE E\s*\([^)]*\)',
+    'F': r'SCHEDULE F\s*\([^)]*\)',
+    'H': r'SCHEDULE H\s*\([^)]*\)',
+    'J': r'SCHEDULE J\s*\([^)]*\)',
+    'K-1': r'SCHEDULE K-1\s*\([^)]*\)',
+    'R': r'SCHEDULE R\s*\([^)]*\)',
+    'SE': r'SCHEDULE SE\s*\([^)]*\)',
+    '1': r'SCHEDULE 1\s*\([^)]*\)',
+    '2': r'SCHEDULE 2\s*\([^)]*\)',
+    '3': r'SCHEDULE 3\s*\([^)]*\)',
+    '8812': r'SCHEDULE 8812\s*\([^)]*\)',
+    'LEP': r'SCHEDULE LEP\s*\([^)]*\)'
+}
+
+# Additional forms that might be attached
+ADDITIONAL_FORM_PATTERNS = {
+    '2441': r'FORM 2441\s*\([^)]*\)',
+    '4562': r'FORM 4562\s*\([^)]*\)',
+    '4684': r'FORM 4684\s*\([^)]*\)',
+    '4797': r'FORM 4797\s*\([^)]*\)',
+    '4868': r'FORM 4868\s*\([^)]*\)',
+    '5329': r'FORM 5329\s*\([^)]*\)',
+    '6251': r'FORM 6251\s*\([^)]*\)',
+    '8283': r'FORM 8283\s*\([^)]*\)',
+    '8582': r'FORM 8582\s*\([^)]*\)',
+    '8606': r'FORM 8606\s*\([^)]*\)',
+    '8829': r'FORM 8829\s*\([^)]*\)',
+    '8949': r'FORM 8949\s*\([^)]*\)'
+}
+
+# Both catalogs as one scanner, so detection cost does not grow with the number of forms. The lookahead
+# lets a header be found even inside another header's parenthesis, exactly like separate findall() passes
+HEADER_SCANNER = re.compile(
+    r"(?=(?P<header>(?:SCHEDULE (?P<schedule_key>{})|FORM (?P<form_key>{}))\s*\([^)]*\)))".format(
+        "|".join(re.escape(key) for key in sorted(MAIN_SCHEDULE_PATTERNS, key=len, reverse=True)),
+        "|".join(re.escape(key) for key in ADDITIONAL_FORM_PATTERNS)
+    ),
+    re.IGNORECASE
+)
+
+
 class LLMOptimizedTextractExtractor:
-    def __init__(self, bucket_name):
+    def __init__(self, bucket_name, notification_channel=None):
         self.s3 = boto3.client('s3', region_name=aws_region,
                     aws_access_key_id=aws_access_key,
                     aws_secret_access_key=aws_secret_key)
@@ -24,12 +76,285 @@ class LLMOptimizedTextractExtractor:
                             aws_access_key_id=aws_access_key,
                             aws_secret_access_key=aws_secret_key)
         self.bucket_name = bucket_name
+        self.feature_types = ["FORMS", "TABLES"]
+        self.job_orchestrator = TextractJobOrchestrator(self.textract, notification_channel)
         
-    def extract_for_llm_processing(self, pdf_path, s3_object_name):
+    @staticmethod
+    def _page_settings(use_text_layer, relevant_pages_only):
+        """
+        Resolve unset page options to USE_PDF_TEXT_LAYER / RELEVANT_PAGES_ONLY
+        """
+        if use_text_layer is None:
+            use_text_layer = config.TEXTRACT_SETTINGS.get("use_text_layer", True)
+        if relevant_pages_only is None:
+            relevant_pages_only = config.TEXTRACT_SETTINGS.get("relevant_pages_only", True)
+        return use_text_layer, relevant_pages_only
+
+    def _select_pages(self, pdf_path, use_text_layer, relevant_pages_only):
+        """
+        ({page number: content items} read from the PDF text layer, [page numbers that need Textract])
+        """
+        if use_text_layer:
+            local_pages, ocr_pages, _ = pdf_text_layer.extract_text_layer(
+                pdf_path, self._group_standalone_elements, relevant_only=relevant_pages_only
+            )
+            return local_pages, ocr_pages
+        if relevant_pages_only:
+            return {}, pdf_text_layer.select_relevant_pages(pdf_path)[0]
+        return {}, list(range(1, (textract_jobs.pdf_page_count(pdf_path) or 0) + 1))
+
+    def extract_for_llm_processing(self, pdf_path, session_id, use_text_layer=None, relevant_pages_only=None,
+                                   line_confidences=None):
         """
         Extract text optimized for LLM-based field mapping and sectioning
         This method focuses on preserving logical structure over exact visual positioning
+        Pages with a usable PDF text layer are read locally; only the remaining pages go to Textract
+        With relevant_pages_only, pages that show none of the mapped forms are left out entirely
+        A line_confidences dict is filled with the Textract confidence behind each formatted line
+        """
+        use_text_layer, relevant_pages_only = self._page_settings(use_text_layer, relevant_pages_only)
+
+        if not use_text_layer:
+            if relevant_pages_only:
+                relevant_pages, page_count = pdf_text_layer.select_relevant_pages(pdf_path)
+                if len(relevant_pages) < page_count:
+                    print(f"✂️ Sending {len(relevant_pages)} of {page_count} pages to Textract")
+                    return self._format_pages_content(
+                        self._textract_pages_content(pdf_path, session_id, relevant_pages), line_confidences
+                    )
+            blocks = self._get_textract_blocks(pdf_path, session_id)
+            self._archive_blocks(blocks, session_id)
+            return self._process_for_llm_sectioning(blocks, line_confidences)
+
+        pages_content, ocr_pages, dropped_pages = pdf_text_layer.extract_text_layer(
+            pdf_path, self._group_standalone_elements, relevant_only=relevant_pages_only
+        )
+        print(f"📄 {len(pages_content)} pages read from the PDF text layer, {len(ocr_pages)} pages need Textract, "
+              f"{len(dropped_pages)} irrelevant pages dropped")
+        if ocr_pages:
+            pages_content.update(self._textract_pages_content(pdf_path, session_id, ocr_pages))
+
+        return self._format_pages_content(pages_content, line_confidences)
+
+    def iter_for_llm_processing(self, pdf_path, session_id, use_text_layer=None, relevant_pages_only=None,
+                                line_confidences=None):
+        """
+        Streaming variant of extract_for_llm_processing that yields the formatted text one page at a time
+        Pages that need Textract are formatted as soon as their blocks have been downloaded, and their blocks
+        are released right after, so memory no longer scales with the whole document.
+        '\n'.join() of the yielded pages equals the extract_for_llm_processing output
+        """
+        use_text_layer, relevant_pages_only = self._page_settings(use_text_layer, relevant_pages_only)
+
+        local_pages, ocr_pages = self._select_pages(pdf_path, use_text_layer, relevant_pages_only)
+
+        ocr_stream = self._iter_textract_pages_content(pdf_path, session_id, ocr_pages) if ocr_pages else iter(())
+        ocr_ready = {}
+        for page_num in sorted(set(local_pages) | set(ocr_pages)):
+            if page_num in local_pages:
+                content = local_pages.pop(page_num)
+            else:
+                # Textract pages arrive in page order; pull until this one is complete
+                for ready_page, ready_content in ocr_stream:
+                    ocr_ready[ready_page] = ready_content
+                    if ready_page >= page_num:
+                        break
+                if page_num not in ocr_ready:
+                    continue
+                content = ocr_ready.pop(page_num)
+            yield self._format_for_llm_consumption([{'page': page_num, 'content': content}], line_confidences)
+
+        # Run the Textract stream to completion so its cache entry gets committed
+        for _ in ocr_stream:
+            pass
+
+    def _iter_textract_pages_content(self, pdf_path, session_id, page_numbers):
+        """
+        Yield (original page number, content items) for the given pages as Textract results come in
+        """
+        subset_path, is_temporary = pdf_text_layer.write_page_subset(pdf_path, page_numbers)
+        try:
+            content_hash = textract_cache.file_sha256(subset_path)
+            blocks = textract_cache.load_blocks(content_hash, self.feature_types)
+            if blocks is not None:
+                print(f"♻️ Reusing cached Textract blocks for {content_hash}")
+                page_blocks_stream = self._iter_blocks_by_page(blocks)
+            else:
+                page_blocks_stream = self._iter_job_blocks_by_page(subset_path, session_id, content_hash)
+
+            archiving = config.TEXTRACT_SETTINGS.get("archive_blocks", True)
+            with block_archive.BestEffortArchiveWriter(session_id, archiving) as archive_writer:
+                for page_num, page_blocks in page_blocks_stream:
+                    archive_writer.write(page_blocks, page_numbers)
+                    for page_info in self._pages_content_from_blocks(page_blocks):
+                        yield page_numbers[page_info['page'] - 1], page_info['content']
+        finally:
+            if is_temporary:
+                os.remove(subset_path)
+
+    def _iter_blocks_by_page(self, blocks):
+        pages = defaultdict(list)
+        for block in blocks:
+            pages[block.get('Page', 1)].append(block)
+        for page_num in sorted(pages):
+            yield page_num, pages.pop(page_num)
+
+    def _iter_job_blocks_by_page(self, pdf_path, session_id, content_hash, max_jobs=None, chunk_pages=None):
+        """
+        Run Textract on a PDF and yield (page, blocks) as soon as each page's blocks are complete
+        PDFs longer than chunk_pages run as page-range jobs, in waves of up to max_jobs that are awaited
+        together, like _get_textract_blocks_many; chunks are downloaded in page-offset order, so pages still
+        come out in order. Blocks are streamed into the cache as they arrive and trimmed to what formatting
+        needs before buffering.
+        """
+        max_jobs = max_jobs or config.TEXTRACT_SETTINGS.get("max_concurrent_jobs", 4)
+        page_ranges = self._page_ranges(pdf_path, chunk_pages)
+
+        with textract_cache.BlockCacheWriter(content_hash, self.feature_types) as cache_writer:
+            for wave_start in range(0, len(page_ranges), max_jobs):
+                chunks = []
+                try:
+                    for page_numbers in page_ranges[wave_start:wave_start + max_jobs]:
+                        chunks.append(self._write_page_range(pdf_path, page_numbers))
+                    job_ids = self._run_job_wave([chunk_path for chunk_path, _, _ in chunks], session_id)
+                finally:
+                    for chunk_path, is_temporary, _ in chunks:
+                        if is_temporary:
+                            os.remove(chunk_path)
+                for job_id, (_, _, page_offset) in zip(job_ids, chunks):
+                    yield from self._iter_job_pages(job_id, page_offset, cache_writer)
+
+    def _page_ranges(self, pdf_path, chunk_pages=None):
+        """
+        Page ranges a PDF is submitted as: [None] (the whole file) up to chunk_pages pages, otherwise lists of
+        at most chunk_pages consecutive 1-based page numbers that run as separate Textract jobs
+        """
+        chunk_pages = chunk_pages or config.TEXTRACT_SETTINGS.get("chunk_pages", 25)
+        page_count = textract_jobs.pdf_page_count(pdf_path)
+        if not page_count or page_count <= chunk_pages:
+            return [None]
+        print(f"✂️ Splitting {page_count} pages into chunks of {chunk_pages} for parallel Textract jobs")
+        return [
+            list(range(first_page, min(first_page + chunk_pages, page_count + 1)))
+            for first_page in range(1, page_count + 1, chunk_pages)
+        ]
+
+    @staticmethod
+    def _write_page_range(pdf_path, page_numbers):
+        """
+        (pdf to submit, is temporary, page offset) for one of _page_ranges' entries
+        """
+        if page_numbers is None:
+            return pdf_path, False, 0
+        chunk_path, is_temporary = pdf_text_layer.write_page_subset(pdf_path, page_numbers)
+        return chunk_path, is_temporary, page_numbers[0] - 1
+
+    def _run_job_wave(self, pdf_paths, session_id):
+        """
+        Start one Textract job per PDF, wait for them together through the job orchestrator and return their
+        JobIds in pdf_paths order. Every job gets its own S3 key, removed once the wave is done
         """
+        s3_object_names = []
+        jobs = {}
+        try:
+            for pdf_path in pdf_paths:
+                s3_object_name = textract_jobs.make_s3_object_name(session_id, textract_cache.file_sha256(pdf_path))
+                s3_object_names.append(s3_object_name)
+                jobs[self._start_textract_job(pdf_path, s3_object_name)] = pdf_path
+            statuses = textract_jobs.run_sync(self.job_orchestrator.wait_for_jobs({
+                job_id: textract_jobs.pdf_page_count(pdf_path) for job_id, pdf_path in jobs.items()
+            }))
+        finally:
+            for s3_object_name in s3_object_names:
+                self.s3.delete_object(Bucket=self.bucket_name, Key=s3_object_name)
+
+        for job_id, pdf_path in jobs.items():
+            if statuses[job_id] != "SUCCEEDED":
+                raise Exception(f"Textract job failed for {pdf_path}.")
+        return list(jobs)
+
+    def _iter_job_pages(self, job_id, page_offset, cache_writer):
+        # Textract returns blocks in page order, so a page is complete once a block from a later page shows up
+        pending = defaultdict(list)
+        next_token = None
+        while True:
+            kwargs = {"JobId": job_id}
+            if next_token:
+                kwargs["NextToken"] = next_token
+            response = self.textract.get_document_analysis(**kwargs)
+            next_token = response.get("NextToken")
+
+            for block in response["Blocks"]:
+                # Cached like _get_textract_blocks_many's merged chunks: pages numbered within the whole PDF
+                block['Page'] = block.get('Page', 1) + page_offset
+                cache_writer.write(block)
+                geometry = block.get('Geometry')
+                if geometry:
+                    # Polygons are never used for formatting
+                    block['Geometry'] = {'BoundingBox': geometry['BoundingBox']}
+                pending[block['Page']].append(block)
+            del response
+
+            latest_page = max(pending) if pending else 0
+            for page_num in sorted(pending):
+                if page_num < latest_page or not next_token:
+                    yield page_num, pending.pop(page_num)
+            if not next_token:
+                break
+
+    def _format_pages_content(self, pages_content, line_confidences=None):
+        """
+        Format {page number: content items} in page order
+        """
+        return self._format_for_llm_consumption([
+            {'page': page_num, 'content': pages_content[page_num]} for page_num in sorted(pages_content)
+        ], line_confidences)
+
+    def _textract_pages_content(self, pdf_path, session_id, page_numbers):
+        """
+        Run Textract on just the given pages and return {original page number: content items}
+        """
+        subset_path, is_temporary = pdf_text_layer.write_page_subset(pdf_path, page_numbers)
+        try:
+            blocks = self._get_textract_blocks(subset_path, session_id)
+        finally:
+            if is_temporary:
+                os.remove(subset_path)
+        self._archive_blocks(blocks, session_id, page_numbers)
+        return {
+            page_numbers[page_info['page'] - 1]: page_info['content']
+            for page_info in self._pages_content_from_blocks(blocks)
+        }
+
+    def _archive_blocks(self, blocks, session_id, page_numbers=None):
+        """
+        Keep the raw blocks in the session's Parquet archive so formatting can be re-run without Textract
+        """
+        if not config.TEXTRACT_SETTINGS.get("archive_blocks", True):
+            return
+        try:
+            block_archive.save_blocks(blocks, session_id, page_numbers)
+        except Exception as e:
+            # The archive is a convenience; never fail an extraction over it
+            print(f"⚠️ Could not archive Textract blocks for {session_id}: {e}")
+
+    def reformat_from_archive(self, session_id, pages=None):
+        """
+        Re-run LLM formatting from the session's archived Textract blocks, without S3 or Textract
+        Only pages that went through Textract are in the archive; returns None if there is no archive
+        """
+        blocks = block_archive.load_blocks(session_id, pages)
+        if blocks is None:
+            return None
+        return self._process_for_llm_sectioning(blocks)
+
+    def _get_textract_blocks(self, pdf_path, session_id):
+        """
+        Textract blocks for a PDF, cached by the file's SHA-256 so re-uploads of the same bytes skip S3 and Textract
+        """
+        return self._get_textract_blocks_many([pdf_path], session_id)[0]
+
+    def _start_textract_job(self, pdf_path, s3_object_name):
         # Upload PDF to S3
         self.s3.upload_file(pdf_path, self.bucket_name, s3_object_name)
         
@@ -41,23 +366,13 @@ class LLMOptimizedTextractExtractor:
                     'Name': s3_object_name
                 }
             },
-            FeatureTypes=["FORMS", "TABLES"]
+            FeatureTypes=self.feature_types
         )
         job_id = response["JobId"]
         print(f"Started Textract job with ID: {job_id}")
-        
-        # Wait for job completion
-        while True:
-            result = self.textract.get_document_analysis(JobId=job_id)
-            status = result["JobStatus"]
-            if status in ["SUCCEEDED", "FAILED"]:
-                break
-            print("Waiting for Textract job to finish...")
-            time.sleep(5)
-            
-        if status != "SUCCEEDED":
-            raise Exception("Textract job failed.")
-            
+        return job_id
+
+    def _get_job_blocks(self, job_id):
         # Get all pages (handle pagination)
         blocks = []
         next_token = None
@@ -72,34 +387,158 @@ class LLMOptimizedTextractExtractor:
             if not next_token:
                 break
                 
-        return self._process_for_llm_sectioning(blocks)
+        return blocks
     
-    def _process_for_llm_sectioning(self, blocks):
+    def extract_many(self, pdf_paths, session_id, max_jobs=None, use_text_layer=None, relevant_pages_only=None,
+                     line_confidences=None):
+        """
+        Run extract_for_llm_processing for several PDFs at once
+        Pages that need OCR are submitted as one Textract job per document, in waves of up to max_jobs
+        that the job orchestrator awaits together from a single thread. Every job gets its own S3 key.
+        Returns the formatted texts in the same order as pdf_paths; a line_confidences list gets one
+        line -> confidence dict per document
+        """
+        use_text_layer, relevant_pages_only = self._page_settings(use_text_layer, relevant_pages_only)
+
+        docs_content = []
+        ocr_requests = []
+        for index, pdf_path in enumerate(pdf_paths):
+            pages_content, ocr_pages = self._select_pages(pdf_path, use_text_layer, relevant_pages_only)
+            docs_content.append(pages_content)
+            if ocr_pages:
+                ocr_requests.append((index, *pdf_text_layer.write_page_subset(pdf_path, ocr_pages), ocr_pages))
+
+        try:
+            blocks_per_request = self._get_textract_blocks_many(
+                [subset_path for _, subset_path, _, _ in ocr_requests], session_id, max_jobs
+            )
+        finally:
+            for _, subset_path, is_temporary, _ in ocr_requests:
+                if is_temporary:
+                    os.remove(subset_path)
+
+        for (index, _, _, page_numbers), blocks in zip(ocr_requests, blocks_per_request):
+            self._archive_blocks(blocks, f"{session_id}_{index}", page_numbers)
+            docs_content[index].update({
+                page_numbers[page_info['page'] - 1]: page_info['content']
+                for page_info in self._pages_content_from_blocks(blocks)
+            })
+
+        texts = []
+        for pages_content in docs_content:
+            doc_confidences = {} if line_confidences is not None else None
+            texts.append(self._format_pages_content(pages_content, doc_confidences))
+            if line_confidences is not None:
+                line_confidences.append(doc_confidences)
+        return texts
+
+    def _get_textract_blocks_many(self, pdf_paths, session_id, max_jobs=None, chunk_pages=None):
+        """
+        Textract blocks for several PDFs, reusing cached results and running the rest as concurrent jobs
+        Documents longer than chunk_pages are split into page ranges that run as separate jobs; their block
+        lists are merged back with Page numbers shifted to the original document
+        """
+        max_jobs = max_jobs or config.TEXTRACT_SETTINGS.get("max_concurrent_jobs", 4)
+        results = [None] * len(pdf_paths)
+
+        content_hashes = {}
+        requests = []  # (document index, pdf to submit, is temporary, page offset)
+        try:
+            for index, pdf_path in enumerate(pdf_paths):
+                content_hash = textract_cache.file_sha256(pdf_path)
+                blocks = textract_cache.load_blocks(content_hash, self.feature_types)
+                if blocks is not None:
+                    print(f"♻️ Reusing cached Textract blocks for {content_hash}")
+                    results[index] = blocks
+                    continue
+
+                content_hashes[index] = content_hash
+                for page_numbers in self._page_ranges(pdf_path, chunk_pages):
+                    requests.append((index, *self._write_page_range(pdf_path, page_numbers)))
+
+            request_blocks = self._run_textract_jobs([pdf_path for _, pdf_path, _, _ in requests], session_id, max_jobs)
+        finally:
+            for _, pdf_path, is_temporary, _ in requests:
+                if is_temporary:
+                    os.remove(pdf_path)
+
+        for index in content_hashes:
+            results[index] = []
+        for (index, _, _, page_offset), blocks in zip(requests, request_blocks):
+            for block in blocks:
+                block['Page'] = block.get('Page', 1) + page_offset
+            results[index].extend(blocks)
+        for index, content_hash in content_hashes.items():
+            textract_cache.save_blocks(content_hash, self.feature_types, results[index])
+
+        return results
+
+    def _run_textract_jobs(self, pdf_paths, session_id, max_jobs):
+        """
+        Run one Textract job per PDF, in waves of up to max_jobs; returns block lists in pdf_paths order
+        """
+        results = []
+        for wave_start in range(0, len(pdf_paths), max_jobs):
+            for job_id in self._run_job_wave(pdf_paths[wave_start:wave_start + max_jobs], session_id):
+                results.append(self._get_job_blocks(job_id))
+        return results
+
+    def _process_for_llm_sectioning(self, blocks, line_confidences=None):
         """
         Process blocks optimized for LLM sectioning and field mapping
         """
-        # Create lookup tables
-        block_map = {block['Id']: block for block in blocks}
+        # Combine all pages into structured text
+        return self._format_for_llm_consumption(self._pages_content_from_blocks(blocks), line_confidences)
+
+    def _pages_content_from_blocks(self, blocks, workers=None):
+        """
+        Per-page content items for a list of Textract blocks, ordered by page number
+        With workers > 1, documents of at least parallel_format_min_pages pages are formatted in a process pool
+        """
+        if workers is None:
+            workers = config.TEXTRACT_SETTINGS.get("format_workers", 0)
         
         # Separate by pages first
         pages = defaultdict(list)
         for block in blocks:
-            page_num = block.get('Page', 1)
-            pages[page_num].append(block)
+            pages[block.get('Page', 1)].append(block)
+        
+        if workers > 1 and len(pages) >= config.TEXTRACT_SETTINGS.get("parallel_format_min_pages", 20):
+            return self._pages_content_parallel(pages, workers)
+        
+        # Index the blocks once; formatting only walks integer indexes from here on
+        store = BlockStore(blocks)
         
         all_pages_content = []
         
-        for page_num in sorted(pages.keys()):
-            page_content = self._process_page_for_llm(pages[page_num], block_map)
+        for page_num in sorted(store.page_indexes.keys()):
+            page_content = self._process_page_for_llm(store.page_indexes[page_num], store)
             all_pages_content.append({
                 'page': page_num,
                 'content': page_content
             })
         
-        # Combine all pages into structured text
-        return self._format_for_llm_consumption(all_pages_content)
+        return all_pages_content
+    
+    def _pages_content_parallel(self, pages, workers):
+        """
+        Format pages in a process pool; each task carries one page's compact block store, never the raw blocks
+        Textract relationships never cross pages, so the per-page stores give the same output as the sequential path
+        """
+        page_nums = sorted(pages.keys())
+        print(f"🧵 Formatting {len(page_nums)} pages with {workers} worker processes")
+        page_stores = (BlockStore(pages[page_num]) for page_num in page_nums)
+        chunksize = max(1, len(page_nums) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # map() yields in submission order, so the output matches the sequential formatter
+            pages_content = list(executor.map(_format_page_store, page_stores, chunksize=chunksize))
+        
+        return [
+            {'page': page_num, 'content': page_content}
+            for page_num, page_content in zip(page_nums, pages_content)
+        ]
     
-    def _process_page_for_llm(self, page_blocks, block_map):
+    def _process_page_for_llm(self, page_indexes, store):
         """
         Process a single page optimized for LLM understanding
         """
@@ -109,91 +548,78 @@ class LLMOptimizedTextractExtractor:
         standalone_text = []
         
         processed_blocks = set()
+        block_types = store.block_types
         
         # Process form fields (key-value pairs)
-        for block in page_blocks:
-            if block['Id'] in processed_blocks:
+        for index in page_indexes:
+            if index in processed_blocks:
                 continue
                 
-            if block['BlockType'] == 'KEY_VALUE_SET' and 'KEY' in block.get('EntityTypes', []):
-                key_text = self._get_text_from_block(block, block_map)
+            if block_types[index] == 'KEY_VALUE_SET' and store.is_key[index]:
+                key_text = self._get_text_from_block(index, store)
                 value_text = ""
+                confidence = store.confidence(index)
                 
                 # Find associated value
-                for relationship in block.get('Relationships', []):
-                    if relationship['Type'] == 'VALUE':
-                        for value_id in relationship['Ids']:
-                            value_block = block_map.get(value_id)
-                            if value_block:
-                                value_text = self._get_text_from_block(value_block, block_map)
-                                processed_blocks.add(value_id)
-                                break
+                for value_index in store.values(index):
+                    value_text = self._get_text_from_block(value_index, store)
+                    confidence = min(confidence, store.confidence(value_index))
+                    processed_blocks.add(value_index)
+                    break
                 
                 if key_text or value_text:
                     form_fields.append({
                         'type': 'form_field',
                         'key': key_text.strip(),
                         'value': value_text.strip(),
-                        'position': block['Geometry']['BoundingBox']['Top']
+                        'position': store.tops[index],
+                        'confidence': confidence
                     })
                 
-                processed_blocks.add(block['Id'])
+                processed_blocks.add(index)
         
         # Process tables
-        for block in page_blocks:
-            if block['Id'] in processed_blocks:
+        for index in page_indexes:
+            if index in processed_blocks:
                 continue
                 
-            if block['BlockType'] == 'TABLE':
-                table_data = self._extract_table_for_llm(block, block_map)
+            if block_types[index] == 'TABLE':
+                table_data = self._extract_table_for_llm(index, store)
                 if table_data:
                     tables.append({
                         'type': 'table',
                         'data': table_data,
-                        'position': block['Geometry']['BoundingBox']['Top']
+                        'position': store.tops[index],
+                        'row_confidences': self._table_row_confidences(index, store)
                     })
                 
                 # Mark all table cells as processed
-                for relationship in block.get('Relationships', []):
-                    if relationship['Type'] == 'CHILD':
-                        for child_id in relationship['Ids']:
-                            processed_blocks.add(child_id)
-                            # Also mark cell children as processed
-                            child_block = block_map.get(child_id)
-                            if child_block:
-                                for child_rel in child_block.get('Relationships', []):
-                                    if child_rel['Type'] == 'CHILD':
-                                        processed_blocks.update(child_rel['Ids'])
+                for child_index in store.children(index):
+                    processed_blocks.add(child_index)
+                    # Also mark cell children as processed
+                    processed_blocks.update(store.children(child_index))
         
         # Process remaining standalone elements
-        standalone_elements = []
-        for block in page_blocks:
-            if block['Id'] in processed_blocks:
-                continue
-                
-            if block['BlockType'] in ['WORD', 'SELECTION_ELEMENT']:
-                bbox = block['Geometry']['BoundingBox']
-                
-                if block['BlockType'] == 'WORD':
-                    text = block['Text']
-                else:
-                    text = "[X]" if block['SelectionStatus'] == 'SELECTED' else "[ ]"
-                
-                standalone_elements.append({
-                    'text': text,
-                    'type': block['BlockType'],
-                    'top': bbox['Top'],
-                    'left': bbox['Left']
-                })
-        
-        # Group standalone elements into logical lines
-        if standalone_elements:
-            lines = self._group_standalone_elements(standalone_elements)
+        standalone_indexes = [
+            index for index in page_indexes
+            if index not in processed_blocks and block_types[index] in ('WORD', 'SELECTION_ELEMENT')
+        ]
+        
+        # Group standalone elements into logical lines, straight from the store's position arrays
+        if standalone_indexes:
+            lines = self._group_lines(
+                np.frombuffer(store.tops)[standalone_indexes],
+                np.frombuffer(store.lefts)[standalone_indexes],
+                [store.texts[index] for index in standalone_indexes],
+                np.frombuffer(store.heights)[standalone_indexes],
+                confidences=np.frombuffer(store.confidences)[standalone_indexes]
+            )
             for line in lines:
                 standalone_text.append({
                     'type': 'text_line',
                     'content': line['content'],
-                    'position': line['position']
+                    'position': line['position'],
+                    'confidence': line['confidence']
                 })
         
         # Combine all content types
@@ -204,26 +630,20 @@ class LLMOptimizedTextractExtractor:
         
         return all_content
     
-    def _extract_table_for_llm(self, table_block, block_map):
+    def _extract_table_for_llm(self, table_index, store):
         """
         Extract table data in a format that's easy for LLMs to understand
         """
-        if 'Relationships' not in table_block:
-            return None
-        
         # Get all cells
         cells = []
-        for relationship in table_block['Relationships']:
-            if relationship['Type'] == 'CHILD':
-                for cell_id in relationship['Ids']:
-                    cell_block = block_map.get(cell_id)
-                    if cell_block and cell_block['BlockType'] == 'CELL':
-                        cell_text = self._get_text_from_block(cell_block, block_map)
-                        cells.append({
-                            'text': cell_text,
-                            'row': cell_block.get('RowIndex', 1),
-                            'col': cell_block.get('ColumnIndex', 1)
-                        })
+        for cell_index in store.children(table_index):
+            if store.block_types[cell_index] == 'CELL':
+                cell_text = self._get_text_from_block(cell_index, store)
+                cells.append({
+                    'text': cell_text,
+                    'row': store.rows[cell_index],
+                    'col': store.cols[cell_index]
+                })
         
         if not cells:
             return None
@@ -246,73 +666,77 @@ class LLMOptimizedTextractExtractor:
         
         return '\n'.join(table_text)
     
-    def _get_text_from_block(self, block, block_map):
+    def _table_row_confidences(self, table_index, store):
+        """
+        Lowest cell confidence per table row, aligned with the rows _extract_table_for_llm writes
+        """
+        row_confidences = {}
+        for cell_index in store.children(table_index):
+            if store.block_types[cell_index] == 'CELL':
+                row = store.rows[cell_index]
+                row_confidences[row] = min(row_confidences.get(row, 100.0), store.confidence(cell_index))
+        return [row_confidences.get(row, 100.0) for row in range(1, max(row_confidences, default=0) + 1)]
+    
+    def _get_text_from_block(self, index, store):
         """
         Extract all text content from a block and its children
         """
-        text_parts = []
-        
-        if 'Relationships' in block:
-            for relationship in block['Relationships']:
-                if relationship['Type'] == 'CHILD':
-                    for child_id in relationship['Ids']:
-                        child_block = block_map.get(child_id)
-                        if child_block:
-                            if child_block['BlockType'] == 'WORD':
-                                text_parts.append(child_block['Text'])
-                            elif child_block['BlockType'] == 'SELECTION_ELEMENT':
-                                checkbox = "[X]" if child_block['SelectionStatus'] == 'SELECTED' else "[ ]"
-                                text_parts.append(checkbox)
-        
-        return ' '.join(text_parts)
+        # Precomputed once per document by the block store
+        return store.text(index)
     
-    def _group_standalone_elements(self, elements, line_tolerance=0.01):
+    def _group_standalone_elements(self, elements, line_tolerance=None):
         """
         Group standalone elements into logical lines for better LLM understanding
         """
         if not elements:
             return []
         
-        # Sort by position
-        elements.sort(key=lambda x: (x['top'], x['left']))
+        return self._group_lines(
+            [elem['top'] for elem in elements],
+            [elem['left'] for elem in elements],
+            [elem['text'] for elem in elements],
+            [elem.get('height', 0.0) for elem in elements],
+            line_tolerance
+        )
+    
+    def _group_lines(self, tops, lefts, texts, heights, line_tolerance=None, confidences=None):
+        """
+        Line grouping over parallel top / left / text / height arrays
+        Without an explicit line_tolerance the fixed default is used, or one derived from the word
+        heights when adaptive line tolerance is enabled. With word confidences, each line also carries
+        the lowest confidence among its words.
+        """
+        if line_tolerance is None:
+            if config.TEXTRACT_SETTINGS.get("adaptive_line_tolerance", False):
+                line_tolerance = adaptive_line_tolerance(heights)
+            else:
+                line_tolerance = DEFAULT_LINE_TOLERANCE
         
         lines = []
-        current_line = [elements[0]]
-        current_top = elements[0]['top']
-        
-        for element in elements[1:]:
-            if abs(element['top'] - current_top) <= line_tolerance:
-                current_line.append(element)
-            else:
-                # Process current line
-                current_line.sort(key=lambda x: x['left'])
-                line_content = ' '.join(elem['text'] for elem in current_line)
-                lines.append({
-                    'content': line_content,
-                    'position': current_top
-                })
-                
-                # Start new line
-                current_line = [element]
-                current_top = element['top']
-        
-        # Don't forget the last line
-        if current_line:
-            current_line.sort(key=lambda x: x['left'])
-            line_content = ' '.join(elem['text'] for elem in current_line)
-            lines.append({
-                'content': line_content,
-                'position': current_top
-            })
+        for line_top, indexes in group_line_indexes(tops, lefts, line_tolerance):
+            line = {
+                'content': ' '.join([texts[index] for index in indexes]),
+                'position': line_top
+            }
+            if confidences is not None:
+                line['confidence'] = float(np.min(confidences[indexes]))
+            lines.append(line)
         
         return lines
     
-    def _format_for_llm_consumption(self, pages_content):
+    def _format_for_llm_consumption(self, pages_content, line_confidences=None):
         """
         Format the extracted content for optimal LLM processing
+        With a line_confidences dict, every formatted line is also recorded there with the lowest Textract
+        confidence behind it (stripped line text -> 0-100); text-layer lines count as 100
         """
         formatted_output = []
         
+        def record(line, confidence):
+            if line_confidences is not None and line.strip():
+                key = line.strip()
+                line_confidences[key] = min(line_confidences.get(key, 100.0), confidence)
+        
         for page_info in pages_content:
             page_num = page_info['page']
             content = page_info['content']
@@ -327,84 +751,75 @@ class LLMOptimizedTextractExtractor:
                         formatted_output.append(f"{item['key']}")
                     elif item['value']:
                         formatted_output.append(f"{item['value']}")
+                    else:
+                        continue
+                    record(formatted_output[-1], item.get('confidence', 100.0))
                 
                 elif item['type'] == 'table':
                     formatted_output.append("TABLE:")
                     formatted_output.append(item['data'])
                     formatted_output.append("")  # Add spacing after tables
+                    row_confidences = item.get('row_confidences', [])
+                    for row_index, row in enumerate(item['data'].split('\n')):
+                        record(row, row_confidences[row_index] if row_index < len(row_confidences) else 100.0)
                 
                 elif item['type'] == 'text_line':
                     formatted_output.append(item['content'])
+                    record(item['content'], item.get('confidence', 100.0))
             
             formatted_output.append("")  # Add spacing between pages
         
         return '\n'.join(formatted_output)
     
-    def detect_all_schedules(self, text):
+    @staticmethod
+    def detect_all_schedules(text):
         """
         Dynamically detect all schedules present in the document
+        One scan finds every header in the catalog; each hit also reports its offset and page number
         """
-        # Common schedule patterns
-        main_schedules = {
-            'A': r'SCHEDULE A\s*\([^)]*\)',
-            'B': r'SCHEDULE B\s*\([^)]*\)',
-            'C': r'SCHEDULE C\s*\([^)]*\)',
-            'D': r'SCHEDULE D\s*\([^)]*\)',
-            'E': r'SCHEDULE E\s*\([^)]*\)',
-            'F': r'SCHEDULE F\s*\([^)]*\)',
-            'H': r'SCHEDULE H\s*\([^)]*\)',
-            'J': r'SCHEDULE J\s*\([^)]*\)',
-            'K-1': r'SCHEDULE K-1\s*\([^)]*\)',
-            'R': r'SCHEDULE R\s*\([^)]*\)',
-            'SE': r'SCHEDULE SE\s*\([^)]*\)',
-            '1': r'SCHEDULE 1\s*\([^)]*\)',
-            '2': r'SCHEDULE 2\s*\([^)]*\)',
-            '3': r'SCHEDULE 3\s*\([^)]*\)',
-            '8812': r'SCHEDULE 8812\s*\([^)]*\)',
-            'LEP': r'SCHEDULE LEP\s*\([^)]*\)'
-        }
-        
-        # Additional forms that might be attached
-        additional_forms = {
-            '2441': r'FORM 2441\s*\([^)]*\)',
-            '4562': r'FORM 4562\s*\([^)]*\)',
-            '4684': r'FORM 4684\s*\([^)]*\)',
-            '4797': r'FORM 4797\s*\([^)]*\)',
-            '4868': r'FORM 4868\s*\([^)]*\)',
-            '5329': r'FORM 5329\s*\([^)]*\)',
-            '6251': r'FORM 6251\s*\([^)]*\)',
-            '8283': r'FORM 8283\s*\([^)]*\)',
-            '8582': r'FORM 8582\s*\([^)]*\)',
-            '8606': r'FORM 8606\s*\([^)]*\)',
-            '8829': r'FORM 8829\s*\([^)]*\)',
-            '8949': r'FORM 8949\s*\([^)]*\)'
-        }
-        
-        detected_schedules = {}
-        detected_forms = {}
-        
-        # Check for main schedules
-        for schedule, pattern in main_schedules.items():
-            matches = re.findall(pattern, text, re.IGNORECASE)
-            if matches:
-                detected_schedules[schedule] = {
-                    'pattern': pattern,
-                    'matches': matches,
-                    'count': len(matches)
-                }
-        
-        # Check for additional forms
-        for form, pattern in additional_forms.items():
-            matches = re.findall(pattern, text, re.IGNORECASE)
-            if matches:
-                detected_forms[form] = {
-                    'pattern': pattern,
-                    'matches': matches,
-                    'count': len(matches)
+        page_offsets, page_nums = page_marker_index(text)
+        
+        detected = {"schedules": {}, "forms": {}}
+        for match in HEADER_SCANNER.finditer(text):
+            group = "schedules" if match.group("schedule_key") else "forms"
+            key = (match.group("schedule_key") or match.group("form_key")).upper()
+            detected_key = detected[group].get(key)
+            # Headers of the same kind never overlap, as with one findall() per pattern
+            if detected_key and match.start() < detected_key['end']:
+                continue
+            
+            header = match.group("header")
+            if not detected_key:
+                pattern = (MAIN_SCHEDULE_PATTERNS if group == "schedules" else ADDITIONAL_FORM_PATTERNS)[key]
+                detected_key = detected[group][key] = {
+                    'pattern': pattern, 'matches': [], 'count': 0, 'offsets': [], 'pages': [], 'end': 0
                 }
-        
+            detected_key['matches'].append(header)
+            detected_key['count'] += 1
+            detected_key['offsets'].append(match.start())
+            detected_key['pages'].append(page_at(page_offsets, page_nums, match.start()))
+            detected_key['end'] = match.start() + len(header)
+        
+        for group in detected.values():
+            for detected_key in group.values():
+                del detected_key['end']
+        
+        # Report in catalog order, like the per-pattern scan did
+        detected_schedules = {key: detected["schedules"][key] for key in MAIN_SCHEDULE_PATTERNS if key in detected["schedules"]}
+        detected_forms = {key: detected["forms"][key] for key in ADDITIONAL_FORM_PATTERNS if key in detected["forms"]}
         return detected_schedules, detected_forms
 
+
+def _format_page_store(page_store):
+    """
+    Process-pool worker: format the single page held by a BlockStore
+    """
+    # Formatting never touches the AWS clients, so skip __init__ in the worker
+    formatter = LLMOptimizedTextractExtractor.__new__(LLMOptimizedTextractExtractor)
+    (page_indexes,) = page_store.page_indexes.values()
+    return formatter._process_page_for_llm(page_indexes, page_store)
+
+
 def save_file_to_local(pdf_file,session_id):
     safe_filename = f"{pdf_file.name.replace('.pdf','')}_{session_id}.pdf"
     pdf_path = os.path.join(upload_dir_path, safe_filename)
@@ -413,22 +828,72 @@ def save_file_to_local(pdf_file,session_id):
     return pdf_path
 
 
+def save_text_for_llm(text_for_llm,session_id):
+    text_file_name=f'{session_id}_text.txt'
+    OUTPUT_TEXT_FILE=config.PATHS.get("raw_text_path","")
+    text_path=os.path.join(OUTPUT_TEXT_FILE, text_file_name)
+    # Save result; a page iterator from iter_for_llm_processing is written as each page arrives
+    with open(text_path, "w", encoding="utf-8") as f:
+        if isinstance(text_for_llm, str):
+            f.write(text_for_llm)
+        else:
+            for index, page_text in enumerate(text_for_llm):
+                f.write(f"\n{page_text}" if index else page_text)
+    return text_path
+
+
+def confidence_file(session_id):
+    return os.path.join(config.PATHS.get("raw_text_path",""), f'{session_id}_confidence.json')
+
+
+def save_line_confidences(line_confidences,session_id):
+    """
+    Save the formatted line -> Textract confidence index next to the session's text file
+    """
+    with open(confidence_file(session_id), "w", encoding="utf-8") as f:
+        json.dump(line_confidences, f, ensure_ascii=False)
+
+
+def load_line_confidences(session_id):
+    """
+    The session's line -> confidence index, or None when the text was saved without one
+    """
+    if not os.path.exists(confidence_file(session_id)):
+        return None
+    with open(confidence_file(session_id), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
 def extract_data(pdf_file,session_id):
     # Test the extraction
     bucket_name = 'spsoft-aiml-workspace'
-    s3_object_name = 'uploaded_1040.pdf'
     
     extractor = LLMOptimizedTextractExtractor(bucket_name)
     pdf_path=save_file_to_local(pdf_file,session_id)
     print("file saved to local")
     # Method 1: Basic LLM-optimized extraction
-    text_for_llm = extractor.extract_for_llm_processing(pdf_path, s3_object_name)
+    line_confidences = {}
+    text_for_llm = extractor.iter_for_llm_processing(pdf_path, session_id, line_confidences=line_confidences)
     # print("=== LLM-OPTIMIZED EXTRACTION ===")
-    text_file_name=f'{session_id}_text.txt'
-    OUTPUT_TEXT_FILE=config.PATHS.get("raw_text_path","")
-    text_path=os.path.join(OUTPUT_TEXT_FILE, text_file_name)
-    # Save result
-    with open(text_path, "w", encoding="utf-8") as f:
-        f.write(text_for_llm)
+    text_path = save_text_for_llm(text_for_llm,session_id)
+    # The page iterator has been drained by now, so the index covers every line
+    save_line_confidences(line_confidences,session_id)
     return text_path
 
+
+def extract_data_many(pdf_files,session_id,max_jobs=None):
+    """
+    Extract several uploaded PDFs in parallel; document i is saved as {session_id}_{i}_text.txt
+    """
+    bucket_name = 'spsoft-aiml-workspace'
+
+    extractor = LLMOptimizedTextractExtractor(bucket_name)
+    doc_session_ids=[f"{session_id}_{index}" for index in range(len(pdf_files))]
+    pdf_paths=[save_file_to_local(pdf_file,doc_session_id) for pdf_file,doc_session_id in zip(pdf_files,doc_session_ids)]
+    print(f"{len(pdf_paths)} files saved to local")
+    line_confidences = []
+    texts_for_llm = extractor.extract_many(pdf_paths, session_id, max_jobs=max_jobs, line_confidences=line_confidences)
+    for doc_confidences,doc_session_id in zip(line_confidences,doc_session_ids):
+        save_line_confidences(doc_confidences,doc_session_id)
+    return [save_text_for_llm(text_for_llm,doc_session_id) for text_for_llm,doc_session_id in zip(texts_for_llm,doc_session_ids)]
+
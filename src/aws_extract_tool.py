@@ -1,7 +1,7 @@
 import boto3
 import os
-import time
-from src import config
+from src import config, textract_cache, textract_jobs
+from src.textract_jobs import TextractJobOrchestrator
 from dotenv import load_dotenv
 
 # Load AWS credentials
@@ -13,6 +13,8 @@ aws_region = os.getenv("AWS_REGION")
 upload_dir_path=config.PATHS.get("upload_dir_path","")
 os.makedirs(upload_dir_path, exist_ok=True)
 
+FEATURE_TYPES = ["FORMS"]
+
 def save_file_to_local(pdf_file,session_id):
     safe_filename = f"{pdf_file.name.replace('.pdf','')}_{session_id}.pdf"
     pdf_path = os.path.join(upload_dir_path, safe_filename)
@@ -20,17 +22,21 @@ def save_file_to_local(pdf_file,session_id):
         f.write(pdf_file.getvalue())
     return pdf_path
 
+S3_BUCKET = 'spsoft-aiml-workspace'  # 📝 Fill in your bucket name
+
+def _s3_client():
+    return boto3.client('s3', region_name=aws_region,
+                    aws_access_key_id=aws_access_key,
+                    aws_secret_access_key=aws_secret_key)
+
 # Upload PDF to S3
-def upload_to_s3(pdf_path):
+def upload_to_s3(pdf_path, s3_object_name):
     # File & S3 Info
     PDF_FILE = pdf_path
-    S3_BUCKET = 'spsoft-aiml-workspace'  # 📝 Fill in your bucket name
-    S3_OBJECT_NAME = 'uploaded_1040.pdf'
+    S3_OBJECT_NAME = s3_object_name
     
     # Boto3 Clients
-    s3 = boto3.client('s3', region_name=aws_region,
-                    aws_access_key_id=aws_access_key,
-                    aws_secret_access_key=aws_secret_key)
+    s3 = _s3_client()
 
     textract = boto3.client('textract', region_name=aws_region,
                             aws_access_key_id=aws_access_key,
@@ -42,23 +48,21 @@ def upload_to_s3(pdf_path):
     # Start Textract analysis
     response = textract.start_document_analysis(
         DocumentLocation={'S3Object': {'Bucket': S3_BUCKET, 'Name': S3_OBJECT_NAME}},
-        FeatureTypes=["FORMS"]
+        FeatureTypes=FEATURE_TYPES
     )
     job_id = response['JobId']
     print(f"Started Textract job: {job_id}")
     return job_id,textract
 
+def delete_from_s3(s3_object_name):
+    _s3_client().delete_object(Bucket=S3_BUCKET, Key=s3_object_name)
+    print(f"Removed {s3_object_name} from S3 bucket {S3_BUCKET}")
+
 # Wait for job to complete
-def wait_for_textract(job_id,textract):
-    while True:
-        result = textract.get_document_analysis(JobId=job_id)
-        status = result['JobStatus']
-        if status == 'SUCCEEDED':
-            return
-        elif status == 'FAILED':
-            raise Exception("Textract job failed.")
-        print("Waiting for Textract job to complete...")
-        time.sleep(5)
+def wait_for_textract(job_id,textract,page_count=None):
+    status = TextractJobOrchestrator(textract).wait(job_id,page_count)
+    if status == 'FAILED':
+        raise Exception("Textract job failed.")
 
 # Get all pages
 def get_all_results(job_id,textract):
@@ -87,9 +91,21 @@ def extract_raw_text(pages):
 # Execute
 def extract_data(pdf_file,session_id):
     pdf_path=save_file_to_local(pdf_file,session_id)
-    job_id,textract=upload_to_s3(pdf_path)
-    wait_for_textract(job_id,textract)
-    pages = get_all_results(job_id,textract)
+    # Same bytes -> same Textract output, so skip S3 and Textract for documents we have already analysed
+    content_hash=textract_cache.file_sha256(pdf_path)
+    blocks=textract_cache.load_blocks(content_hash,FEATURE_TYPES)
+    if blocks is not None:
+        print(f"♻️ Reusing cached Textract blocks for {content_hash}")
+        pages=[{"Blocks": blocks}]
+    else:
+        s3_object_name=textract_jobs.make_s3_object_name(session_id,content_hash)
+        try:
+            job_id,textract=upload_to_s3(pdf_path,s3_object_name)
+            wait_for_textract(job_id,textract,textract_jobs.pdf_page_count(pdf_path))
+            pages = get_all_results(job_id,textract)
+        finally:
+            delete_from_s3(s3_object_name)
+        textract_cache.save_blocks(content_hash,FEATURE_TYPES,[block for page in pages for block in page['Blocks']])
     raw_text = extract_raw_text(pages)
     text_file_name=f'{session_id}_text.txt'
     OUTPUT_TEXT_FILE=config.PATHS.get("raw_text_path","")
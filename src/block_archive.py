@@ -0,0 +1,203 @@
+import os
+import pyarrow as pa
+import pyarrow.parquet as pq
+from src import config
+
+block_archive_path = config.PATHS.get("block_archive_path", "")
+os.makedirs(block_archive_path, exist_ok=True)
+
+# One row per Textract block. Geometry keeps the bounding box only; polygons are never used downstream
+BLOCK_SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("block_type", pa.dictionary(pa.int8(), pa.string())),
+    ("page", pa.int32()),
+    ("top", pa.float64()),
+    ("left", pa.float64()),
+    ("width", pa.float64()),
+    ("height", pa.float64()),
+    ("text", pa.string()),
+    ("confidence", pa.float64()),
+    ("text_type", pa.string()),
+    ("selection_status", pa.string()),
+    ("entity_types", pa.list_(pa.string())),
+    ("row_index", pa.int32()),
+    ("column_index", pa.int32()),
+    ("row_span", pa.int32()),
+    ("column_span", pa.int32()),
+    ("relationships", pa.list_(pa.struct([("type", pa.string()), ("ids", pa.list_(pa.string()))]))),
+])
+
+# Archive column -> Textract block key, for the flat fields that map one to one
+FLAT_FIELDS = [
+    ("text", "Text"),
+    ("confidence", "Confidence"),
+    ("text_type", "TextType"),
+    ("selection_status", "SelectionStatus"),
+    ("entity_types", "EntityTypes"),
+    ("row_index", "RowIndex"),
+    ("column_index", "ColumnIndex"),
+    ("row_span", "RowSpan"),
+    ("column_span", "ColumnSpan"),
+]
+
+
+def archive_file(session_id):
+    return os.path.join(block_archive_path, f"{session_id}_blocks.parquet")
+
+
+def _blocks_to_table(blocks, page_numbers=None):
+    bboxes = [block['Geometry']['BoundingBox'] if 'Geometry' in block else {} for block in blocks]
+    pages = [block.get('Page', 1) for block in blocks]
+    if page_numbers:
+        # Blocks of a page-subset PDF are archived under the original document's page numbers
+        pages = [page_numbers[page - 1] for page in pages]
+
+    columns = {
+        "id": [block['Id'] for block in blocks],
+        "block_type": [block['BlockType'] for block in blocks],
+        "page": pages,
+        "top": [bbox.get('Top') for bbox in bboxes],
+        "left": [bbox.get('Left') for bbox in bboxes],
+        "width": [bbox.get('Width') for bbox in bboxes],
+        "height": [bbox.get('Height') for bbox in bboxes],
+        "relationships": [
+            [{"type": rel['Type'], "ids": rel['Ids']} for rel in block['Relationships']]
+            if 'Relationships' in block else None
+            for block in blocks
+        ],
+    }
+    for column, key in FLAT_FIELDS:
+        columns[column] = [block.get(key) for block in blocks]
+    return pa.Table.from_pydict(columns, schema=BLOCK_SCHEMA)
+
+
+class BlockArchiveWriter:
+    """
+    Appends Textract blocks to a per-document Parquet archive, one row group per write() call
+    The archive is only moved into place on a clean exit, so readers never see a half-written file
+    """
+
+    def __init__(self, session_id):
+        self.archive_file = archive_file(session_id)
+        self.tmp_file = f"{self.archive_file}.tmp"
+        self._writer = None
+
+    def __enter__(self):
+        self._writer = pq.ParquetWriter(self.tmp_file, BLOCK_SCHEMA, compression="zstd")
+        return self
+
+    def write(self, blocks, page_numbers=None):
+        if blocks:
+            self._writer.write_table(_blocks_to_table(blocks, page_numbers))
+
+    def __exit__(self, exc_type, exc, tb):
+        self._writer.close()
+        if exc_type is None:
+            os.replace(self.tmp_file, self.archive_file)
+        else:
+            os.remove(self.tmp_file)
+        return False
+
+
+class BestEffortArchiveWriter:
+    """
+    BlockArchiveWriter for the streaming extraction path: the archive is a convenience, so the first error
+    (opening, writing or moving it into place) discards it and turns archiving off instead of failing the
+    extraction. With enabled=False it accepts writes and does nothing.
+    """
+
+    def __init__(self, session_id, enabled=True):
+        self.session_id = session_id
+        self._writer = BlockArchiveWriter(session_id) if enabled else None
+
+    def _discard(self, e):
+        print(f"⚠️ Could not archive Textract blocks for {self.session_id}, continuing without the archive: {e}")
+        writer, self._writer = self._writer, None
+        try:
+            if writer._writer is not None:
+                writer._writer.close()
+            if os.path.exists(writer.tmp_file):
+                os.remove(writer.tmp_file)
+        except Exception:
+            pass
+
+    def __enter__(self):
+        if self._writer is not None:
+            try:
+                self._writer.__enter__()
+            except Exception as e:
+                self._discard(e)
+        return self
+
+    def write(self, blocks, page_numbers=None):
+        if self._writer is not None:
+            try:
+                self._writer.write(blocks, page_numbers)
+            except Exception as e:
+                self._discard(e)
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._writer is not None:
+            try:
+                self._writer.__exit__(exc_type, exc, tb)
+            except Exception as e:
+                self._discard(e)
+        return False
+
+
+def save_blocks(blocks, session_id, page_numbers=None):
+    """
+    Write a document's raw Textract blocks to {session_id}_blocks.parquet
+    page_numbers maps the 1-based pages of a page-subset PDF back to the original document
+    """
+    with BlockArchiveWriter(session_id) as writer:
+        writer.write(blocks, page_numbers)
+    return writer.archive_file
+
+
+def read_table(session_id, columns=None, pages=None):
+    """
+    The archive as a pyarrow Table, optionally restricted to some columns and pages, for bulk analytics
+    """
+    filters = [("page", "in", list(pages))] if pages else None
+    return pq.read_table(archive_file(session_id), columns=columns, filters=filters)
+
+
+def load_blocks(session_id, pages=None):
+    """
+    Rebuild Textract-shaped block dicts from the archive, ready for _process_for_llm_sectioning
+    Returns None if no archive exists for this session
+    """
+    if not os.path.exists(archive_file(session_id)):
+        return None
+    table = read_table(session_id, pages=pages)
+    # Decoding the dictionary column in Arrow is far cheaper than converting it value by value
+    columns = {
+        name: (column.cast(pa.string()) if name == "block_type" else column).to_pylist()
+        for name, column in zip(table.column_names, table.columns)
+    }
+
+    blocks = [
+        {
+            'Id': block_id,
+            'BlockType': block_type,
+            'Page': page,
+            'Geometry': {'BoundingBox': {'Width': width, 'Height': height, 'Left': left, 'Top': top}},
+        }
+        for block_id, block_type, page, top, left, width, height in zip(
+            columns["id"], columns["block_type"], columns["page"],
+            columns["top"], columns["left"], columns["width"], columns["height"]
+        )
+    ]
+    for block, top in zip(blocks, columns["top"]):
+        if top is None:
+            del block['Geometry']
+    # Nulls mean the key was absent from the original block
+    for column, key in FLAT_FIELDS:
+        for block, value in zip(blocks, columns[column]):
+            if value is not None:
+                block[key] = value
+    for block, relationships in zip(blocks, columns["relationships"]):
+        if relationships is not None:
+            block['Relationships'] = [{'Type': rel["type"], 'Ids': rel["ids"]} for rel in relationships]
+    return blocks
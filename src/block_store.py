@@ -0,0 +1,141 @@
+from array import array
+from collections import defaultdict
+
+# Block types whose relationships formatting follows
+LINKED_BLOCK_TYPES = frozenset({'KEY_VALUE_SET', 'TABLE', 'CELL'})
+
+
+class BlockStore:
+    """
+    Compact, index-based view of a list of Textract blocks
+    Block ids are interned to integer indexes, the attributes formatting needs live in parallel arrays,
+    and CHILD / VALUE relationships are kept as CSR-style offset + index arrays
+    """
+
+    __slots__ = (
+        "block_types", "pages", "tops", "lefts", "heights", "texts", "is_key", "rows", "cols",
+        "child_offsets", "child_indexes", "value_offsets", "value_indexes", "page_indexes", "block_texts",
+        "confidences", "block_confidences",
+    )
+
+    def __init__(self, blocks):
+        index_of = {block['Id']: index for index, block in enumerate(blocks)}
+
+        block_count = len(blocks)
+        block_types = []
+        pages = []
+        # WORD text or the checkbox rendering of a SELECTION_ELEMENT, None for every other block type
+        texts = []
+        tops = array('d', bytes(8 * block_count))
+        lefts = array('d', bytes(8 * block_count))
+        heights = array('d', bytes(8 * block_count))
+        # Textract confidence (0-100); blocks without one count as certain
+        confidences = array('d', bytes(8 * block_count))
+        is_key = bytearray(block_count)
+        rows = array('i', bytes(4 * block_count))
+        cols = array('i', bytes(4 * block_count))
+        child_offsets = [0]
+        child_indexes = []
+        value_offsets = [0]
+        value_indexes = []
+
+        # One pass over the response dicts with locally bound appends. Reading the dicts dominates the build,
+        # so each block type only touches the fields formatting uses (PAGE and LINE blocks are never followed)
+        add_type, add_page, add_text = block_types.append, pages.append, texts.append
+        for index, block in enumerate(blocks):
+            block_type = block['BlockType']
+            add_type(block_type)
+            add_page(block.get('Page', 1))
+            confidences[index] = block.get('Confidence', 100.0)
+
+            if block_type == 'WORD':
+                add_text(block['Text'])
+            elif block_type == 'SELECTION_ELEMENT':
+                add_text("[X]" if block.get('SelectionStatus') == 'SELECTED' else "[ ]")
+            else:
+                add_text(None)
+                if block_type not in LINKED_BLOCK_TYPES:
+                    child_offsets.append(len(child_indexes))
+                    value_offsets.append(len(value_indexes))
+                    continue
+                if block_type == 'CELL':
+                    rows[index] = block.get('RowIndex', 1)
+                    cols[index] = block.get('ColumnIndex', 1)
+                elif block_type == 'KEY_VALUE_SET' and 'KEY' in block.get('EntityTypes', ()):
+                    is_key[index] = 1
+
+                for relationship in block.get('Relationships', ()):
+                    if relationship['Type'] == 'CHILD':
+                        targets = child_indexes
+                    elif relationship['Type'] == 'VALUE':
+                        targets = value_indexes
+                    else:
+                        continue
+                    # Ids outside this block list are dropped here; lookups used to skip them anyway
+                    targets.extend(index_of[related_id] for related_id in relationship['Ids'] if related_id in index_of)
+
+            if block_type != 'CELL':
+                bbox = block['Geometry']['BoundingBox']
+                tops[index] = bbox['Top']
+                lefts[index] = bbox['Left']
+                heights[index] = bbox.get('Height', 0.0)
+            child_offsets.append(len(child_indexes))
+            value_offsets.append(len(value_indexes))
+
+        self.block_types = block_types
+        self.pages = array('i', pages)
+        self.tops = tops
+        self.lefts = lefts
+        self.heights = heights
+        self.confidences = confidences
+        self.texts = texts
+        self.is_key = is_key
+        self.rows = rows
+        self.cols = cols
+        self.child_offsets = array('i', child_offsets)
+        self.child_indexes = array('i', child_indexes)
+        self.value_offsets = array('i', value_offsets)
+        self.value_indexes = array('i', value_indexes)
+
+        # Text of every composite block (KEY / VALUE sets and table cells), joined once per document so
+        # key-value and table formatting become lookups instead of re-walking the same words.
+        # A composite block is only as confident as its least confident word
+        block_texts = {}
+        block_confidences = {}
+        for index in range(block_count):
+            start, end = child_offsets[index], child_offsets[index + 1]
+            if start != end:
+                children = child_indexes[start:end]
+                child_texts = [texts[child_index] for child_index in children]
+                block_texts[index] = ' '.join(text for text in child_texts if text is not None)
+                block_confidences[index] = min(
+                    confidences[index], min(confidences[child_index] for child_index in children)
+                )
+        self.block_texts = block_texts
+        self.block_confidences = block_confidences
+
+        page_indexes = defaultdict(list)
+        for index, page_num in enumerate(pages):
+            page_indexes[page_num].append(index)
+        self.page_indexes = {page_num: array('i', indexes) for page_num, indexes in page_indexes.items()}
+
+    def __len__(self):
+        return len(self.block_types)
+
+    def children(self, index):
+        return self.child_indexes[self.child_offsets[index]:self.child_offsets[index + 1]]
+
+    def text(self, index):
+        """
+        Words and checkbox renderings of a block's children joined with spaces, '' for blocks without children
+        """
+        return self.block_texts.get(index, '')
+
+    def confidence(self, index):
+        """
+        Lowest Textract confidence among a block and its children
+        """
+        return self.block_confidences.get(index, self.confidences[index])
+
+    def values(self, index):
+        return self.value_indexes[self.value_offsets[index]:self.value_offsets[index + 1]]
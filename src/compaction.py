@@ -0,0 +1,88 @@
+import re
+from src import token_budget
+
+# Marks a ticked or empty box: Textract's "[X]" / "[ ]", or a bare X in text-layer output ("Check only X Married ...")
+CHECKBOX_PATTERN = re.compile(r"\[[X ]\]|(?<!\S)X(?!\S)")
+TRAILING_CHECKBOX_PATTERN = re.compile(r":?\s*(\[[X ]\])$")
+# Lines at least this long with no digit, box, cell or key-value pair are form instructions
+PROSE_MIN_WORDS = 8
+# Lines that delimit structure rather than carry content; repeats are meaningful (one per table / page)
+STRUCTURE_PATTERN = re.compile(r"^(?:TABLE:|=== PAGE \d+ ===)$")
+
+
+def _line_key(line):
+    # "(A) Short-term ...: [X]" and "[X] (A) Short-term ..." are the same line printed as a pair and as text
+    match = TRAILING_CHECKBOX_PATTERN.search(line)
+    if match:
+        line = f"{match.group(1)} {line[:match.start()]}"
+    return " ".join(line.replace(":", " ").replace("|", " ").split()).casefold()
+
+
+def _is_prose(line):
+    return (
+        len(line.split()) >= PROSE_MIN_WORDS and ": " not in line and "|" not in line
+        and not any(char.isdigit() for char in line) and not CHECKBOX_PATTERN.search(line)
+    )
+
+
+def compact_section(section_text):
+    """
+    Section text with what the LLM does not need dropped: empty table rows, form instruction prose, repeated
+    lines without digits (page headers printed again, "key: value" pairs repeated as text), text lines
+    repeating a table row and bare lines that only repeat the key or value of a "key: value" line.
+    A line with digits is never dropped for repeating an earlier line of its own kind, since two identical
+    transactions are both real, and TABLE: / page markers are always kept. Line order is unchanged.
+    """
+    lines = [line.strip() for line in section_text.splitlines()]
+    pair_parts, table_rows = set(), set()
+    for line in lines:
+        if "|" in line:
+            table_rows.add(_line_key(line))
+        elif ": " in line:
+            key, value = line.split(": ", 1)
+            pair_parts.update((_line_key(key), _line_key(value)))
+
+    kept, seen = [], set()
+    for line in lines:
+        if not line:
+            continue
+        if STRUCTURE_PATTERN.match(line):
+            kept.append(line)
+            continue
+        if "|" in line:
+            if not line.replace("|", "").strip():
+                continue
+        elif (
+            _is_prose(line) or _line_key(line) in table_rows
+            or (": " not in line and _line_key(line) in pair_parts)
+        ):
+            continue
+        if any(char.isdigit() for char in line):
+            kept.append(line)
+            continue
+        line_key = _line_key(line)
+        if line_key in seen:
+            continue
+        seen.add(line_key)
+        kept.append(line)
+    return "\n".join(kept)
+
+
+def split_section(section_text, max_tokens):
+    """
+    Section text in consecutive chunks of whole lines, each at most max_tokens (a single longer line is its own
+    chunk). Returns [section_text] when it already fits.
+    """
+    if token_budget.count_tokens(section_text) <= max_tokens:
+        return [section_text]
+    chunks, chunk, chunk_tokens = [], [], 0
+    for line in section_text.splitlines():
+        line_tokens = token_budget.count_tokens(line + "\n")
+        if chunk and chunk_tokens + line_tokens > max_tokens:
+            chunks.append("\n".join(chunk))
+            chunk, chunk_tokens = [], 0
+        chunk.append(line)
+        chunk_tokens += line_tokens
+    if chunk:
+        chunks.append("\n".join(chunk))
+    return chunks
@@ -6,6 +6,44 @@ PATHS = {
     "raw_text_path": os.path.join(BASE_DIR, "extracted_raw_data"),
     "section_save_path": os.path.join(BASE_DIR, "sectioned_data"),
     "recommendation_json_path": os.path.join(BASE_DIR, "recommendations_json_data"),
-    "json_data_path": os.path.join(BASE_DIR, "extracted_json_data")
+    "json_data_path": os.path.join(BASE_DIR, "extracted_json_data"),
+    "llm_cache_path": os.path.join(BASE_DIR, "cache", "llm_responses.sqlite3"),
+    "textract_cache_path": os.path.join(BASE_DIR, "cache", "textract"),
+    "block_archive_path": os.path.join(BASE_DIR, "extracted_blocks")
+}
+  
+LLM_SETTINGS = {
+    "max_concurrency": int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+    "cache_max_entries": int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000")),
+    "cache_max_age_seconds": int(os.getenv("LLM_CACHE_MAX_AGE_DAYS", "30")) * 24 * 3600,
+    # Minimum RapidFuzz score (0-100) for a Textract key to fill a field without the LLM
+    "kv_match_threshold": float(os.getenv("KV_MATCH_THRESHOLD", "90")),
+    # Minimum Textract confidence (0-100) for a directly read field to skip the LLM
+    "min_field_confidence": float(os.getenv("MIN_FIELD_CONFIDENCE", "90")),
+    # Pack small sections into shared prompts of at most batch_token_budget tokens (counted with token_encoding)
+    "batch_sections": os.getenv("LLM_BATCH_SECTIONS", "1") == "1",
+    "batch_token_budget": int(os.getenv("LLM_BATCH_TOKEN_BUDGET", "6000")),
+    "token_encoding": os.getenv("LLM_TOKEN_ENCODING", "cl100k_base"),
+    # Drop boilerplate from section text before prompting; sections still over section_token_budget are split
+    "compact_sections": os.getenv("LLM_COMPACT_SECTIONS", "1") == "1",
+    "section_token_budget": int(os.getenv("LLM_SECTION_TOKEN_BUDGET", "3000"))
+}
+
+REGEX_SETTINGS = {
+    # Time budget per section-pattern call before it falls back to a cheaper pattern
+    "timeout_seconds": float(os.getenv("REGEX_TIMEOUT_SECONDS", "2"))
+}
+
+TEXTRACT_SETTINGS = {
+    "max_concurrent_jobs": int(os.getenv("TEXTRACT_MAX_CONCURRENT_JOBS", "4")),
+    "max_poll_delay": float(os.getenv("TEXTRACT_MAX_POLL_DELAY", "5")),
+    "use_text_layer": os.getenv("USE_PDF_TEXT_LAYER", "1") == "1",
+    "min_text_layer_words": int(os.getenv("MIN_TEXT_LAYER_WORDS", "20")),
+    "relevant_pages_only": os.getenv("RELEVANT_PAGES_ONLY", "1") == "1",
+    "chunk_pages": int(os.getenv("TEXTRACT_CHUNK_PAGES", "25")),
+    "adaptive_line_tolerance": os.getenv("ADAPTIVE_LINE_TOLERANCE", "0") == "1",
+    # 0 or 1 formats pages sequentially
+    "format_workers": int(os.getenv("TEXTRACT_FORMAT_WORKERS", "0")),
+    "parallel_format_min_pages": int(os.getenv("PARALLEL_FORMAT_MIN_PAGES", "20")),
+    "archive_blocks": os.getenv("ARCHIVE_TEXTRACT_BLOCKS", "1") == "1"
 }
-  
\ No newline at end of file
@@ -1,14 +1,189 @@
 import os
 import re
 import json
-from src import config
+from concurrent.futures import ThreadPoolExecutor
+from src import compaction, config, pattern_registry, sectioning, table_rows, token_budget
+from src.advanced_extraction_tool import LLMOptimizedTextractExtractor, load_line_confidences
+from src.kv_index import KeyValueIndex
+from src.llm_cache import get_llm_cache
 from typing import Dict, Any, List
 from openai import OpenAI
 from dotenv import load_dotenv
 load_dotenv()
 
+# (output key, section key, fields) for every section sent to the LLM, in output order
+SECTION_FIELDS = [
+    ("basic_info", "basic_info", [
+        "taxpayer_name", "spouse_name", "ssn", "spouse_ssn", "address", "city", "state", "zip_code", "filing_status"
+    ]),
+    ("income_section", "income", [
+        "wages", "taxable_interest", "qualified_dividends", "ordinary_dividends",
+        "capital_gains_or_loss", "total_income", "adjusted_gross_income",
+        "standard_or_itemized_deduction", "total_deductions", "taxable_income"
+    ]),
+    ("tax_section", "tax", [
+        "income_tax", "child_tax_credit", "other_credits", "total_credits",
+        "additional_taxes", "total_tax"
+    ]),
+    ("payment_section", "payments", [
+        "federal_withholding_w2", "federal_withholding_1099", "other_withholding",
+        "federal_total_withholding", "estimated_payments", "total_payments",
+        "refund", "amount_owed"
+    ]),
+    ("schedule_1", "schedule_1", [
+        "additional_income", "adjustments_to_income", "taxable_refunds", "alimony_received",
+        "business_income", "capital_gain_loss", "other_gains_losses", "rental_income",
+        "unemployment_compensation", "other_income", "educator_expenses", "business_expenses",
+        "hsa_deduction", "moving_expenses", "se_tax_deduction", "sep_simple_ira",
+        "self_employed_health", "penalty_early_withdrawal", "alimony_paid", "ira_deduction",
+        "student_loan_interest"
+    ]),
+    ("schedule_2", "schedule_2", [
+        "amt", "excess_advance_ptc", "additional_taxes_other", "total_schedule_2"
+    ]),
+    ("schedule_3", "schedule_3", [
+        "foreign_tax_credit", "child_dependent_care_credit", "education_credits",
+        "retirement_savings_credit", "residential_energy_credit", "other_nonrefundable_credits",
+        "total_other_credits", "net_ptc", "amount_paid_extension", "excess_ss_tax",
+        "credit_tax_paid_forms", "other_payments", "total_other_payments"
+    ]),
+    ("schedule_a", "schedule_a", [
+        "medical_dental", "state_local_income_tax", "state_local_sales_tax", "real_estate_tax",
+        "personal_property_tax", "other_taxes", "home_mortgage_interest", "home_mortgage_points",
+        "mortgage_insurance_premiums", "investment_interest", "charitable_cash", "charitable_noncash",
+        "charitable_carryover", "casualty_theft_losses", "other_itemized", "total_itemized"
+    ]),
+    ("schedule_b", "schedule_b", [
+        "total_interest", "total_dividends", "foreign_accounts", "foreign_trust"
+    ]),
+    ("schedule_c", "schedule_c", [
+        "gross_receipts", "returns_allowances", "cost_of_goods_sold", "gross_profit",
+        "total_expenses", "net_profit_loss"
+    ]),
+    ("schedule_d", "schedule_d", [
+        "short_term_gain_loss", "long_term_gain_loss", "total_capital_gain_loss",
+        "capital_gain_distributions", "unrecaptured_section_1250", "collectibles_gain"
+    ]),
+    ("schedule_e", "schedule_e", [
+        "rental_real_estate_income", "royalty_income", "partnership_s_corp_income",
+        "estate_trust_income", "total_supplemental_income"
+    ]),
+    ("schedule_f", "schedule_f", [
+        "gross_farm_income", "farm_expenses", "net_farm_profit_loss"
+    ]),
+    ("schedule_h", "schedule_h", [
+        "household_wages", "household_ss_medicare", "household_futa", "total_household_tax"
+    ]),
+    ("schedule_j", "schedule_j", [
+        "elected_farm_income", "average_income"
+    ]),
+    ("schedule_r", "schedule_r", [
+        "credit_elderly_disabled"
+    ]),
+    ("schedule_se", "schedule_se", [
+        "net_earnings_se", "self_employment_tax", "deductible_se_tax"
+    ]),
+    ("form_4868", "form_4868", [
+        "extension_payment"
+    ]),
+    ("form_8812", "form_8812", [
+        "additional_child_tax_credit", "earned_income"
+    ]),
+    ("form_8829", "form_8829", [
+        "home_office_area", "total_home_area", "home_office_percentage", "home_office_deduction"
+    ]),
+    ("schedule_eic", "schedule_eic", [
+        "earned_income_credit", "qualifying_children_eic"
+    ]),
+]
+
+# Section key -> field -> Form 1040 line numbers holding it, in order of preference. These fields are read
+# straight from the section's "<line> | <amount>" rows; only fields without such a row go to the LLM.
+# The numbers follow the Form 1040 of SECTION_LINE_NUMBER_TAX_YEARS (wages on 1z, deduction on 12, total tax
+# on 24); earlier forms number these lines differently (2019: 9 is the standard deduction, 16 the total tax)
+SECTION_LINE_NUMBER_TAX_YEARS = {"2022", "2023", "2024"}
+SECTION_LINE_NUMBERS = {
+    "income": {
+        "wages": ("1z", "1a"),
+        "taxable_interest": ("2b",),
+        "qualified_dividends": ("3a",),
+        "ordinary_dividends": ("3b",),
+        "capital_gains_or_loss": ("7",),
+        "total_income": ("9",),
+        "adjusted_gross_income": ("11",),
+        "standard_or_itemized_deduction": ("12",),
+        "total_deductions": ("14",),
+        "taxable_income": ("15",),
+    },
+    "tax": {
+        "income_tax": ("16",),
+        "child_tax_credit": ("19",),
+        "other_credits": ("20",),
+        "total_credits": ("21",),
+        "additional_taxes": ("23",),
+        "total_tax": ("24",),
+    },
+    "payments": {
+        "federal_withholding_w2": ("25a",),
+        "federal_withholding_1099": ("25b",),
+        "other_withholding": ("25c",),
+        "federal_total_withholding": ("25d",),
+        "estimated_payments": ("26",),
+        "total_payments": ("33",),
+        "refund": ("35a", "34"),
+        "amount_owed": ("37",),
+    },
+}
+
+# Instruction block shared by the per-section and batched extraction prompts. The continuation lines keep
+# the prompt's original indentation so cached responses for unchanged prompts stay valid
+EXTRACTION_RULES = """You are an IRS Form 1040 parsing expert.
+
+        INSTRUCTIONS:
+        - Extract the requested fields listed below. Return a **valid JSON only**, no commentary.
+        - If a field is **missing entirely**, set its value to `null`.
+        - If a field is **present but blank or shows $0**, return 0.
+        - For **all monetary fields**, extract ONLY the actual dollar amount **entered by the taxpayer** — do NOT return labels or line numbers.
+
+        ⚠️ IMPORTANT RULES FOR TABLE FORMATTING:
+        - **Do NOT extract line numbers (e.g., 1, 2, 3)** — these are structural references, NOT taxpayer data.
+        - When parsing a table:
+        1. For each field, locate the field name or keyword.
+        2. Extract the **numeric value that appears to the right of the final pipe (`|`) on that line**, if it exists and is not a line number.
+            - ✅ Example: `"1 Foreign tax credit ... |  |  | 1 | 5"` → `"foreign_tax_credit": 5`
+            - ❌ Do NOT return `1` as the value, that’s the line number, not data.
+            - ❌ If a field appears but there is no value after the last `|`, return `0` or `null`."""
+
+# Answer tokens reserved per requested field when sizing batches and their max_tokens
+OUTPUT_TOKENS_PER_FIELD = 40
+
+# Sections extracted on every return, even when their text could not be sliced
+CORE_SECTIONS = {"basic_info", "income", "tax", "payments"}
+
+# Section key -> (detect_all_schedules result group, schedule/form key)
+SECTION_DETECTION_KEYS = {
+    "schedule_1": ("schedules", "1"),
+    "schedule_2": ("schedules", "2"),
+    "schedule_3": ("schedules", "3"),
+    "schedule_a": ("schedules", "A"),
+    "schedule_b": ("schedules", "B"),
+    "schedule_c": ("schedules", "C"),
+    "schedule_d": ("schedules", "D"),
+    "schedule_e": ("schedules", "E"),
+    "schedule_f": ("schedules", "F"),
+    "schedule_h": ("schedules", "H"),
+    "schedule_j": ("schedules", "J"),
+    "schedule_r": ("schedules", "R"),
+    "schedule_se": ("schedules", "SE"),
+    "form_8812": ("schedules", "8812"),
+    "form_4868": ("forms", "4868"),
+    "form_8829": ("forms", "8829"),
+}
+
 class TaxDocumentExtractor:
-    def __init__(self):
+    def __init__(self, max_concurrency=None):
+        self.max_concurrency = max_concurrency or config.LLM_SETTINGS.get("max_concurrency", 8)
+        self.llm_cache = get_llm_cache()
         self.groq_client = OpenAI(
             api_key=os.getenv("GROQ_API_KEY"),
             base_url="https://api.groq.com/openai/v1"
@@ -187,6 +362,7 @@ class TaxDocumentExtractor:
             "earned_income_credit": "Extract earned income credit amount",
             "qualifying_children_eic": "Extract number of qualifying children for EIC"
         }
+        self.kv_index = KeyValueIndex(self.field_descriptions)
 
 
     def extract_section_data_llm(self, section_text: str, section_name: str, field_list: List[str]) -> Dict[str, Any]:
@@ -195,27 +371,10 @@ class TaxDocumentExtractor:
         if not self.groq_client:
             raise ValueError("Groq client not initialized. Set GROQ_API_KEY.")
 
-        fields_description = "\n".join(
-            [f"- {field}: {self.field_descriptions.get(field, field)}" for field in field_list]
-        )
+        fields_description = self._fields_description(field_list)
         
         prompt = f"""
-        You are an IRS Form 1040 parsing expert.
-
-        INSTRUCTIONS:
-        - Extract the requested fields listed below. Return a **valid JSON only**, no commentary.
-        - If a field is **missing entirely**, set its value to `null`.
-        - If a field is **present but blank or shows $0**, return 0.
-        - For **all monetary fields**, extract ONLY the actual dollar amount **entered by the taxpayer** — do NOT return labels or line numbers.
-
-        ⚠️ IMPORTANT RULES FOR TABLE FORMATTING:
-        - **Do NOT extract line numbers (e.g., 1, 2, 3)** — these are structural references, NOT taxpayer data.
-        - When parsing a table:
-        1. For each field, locate the field name or keyword.
-        2. Extract the **numeric value that appears to the right of the final pipe (`|`) on that line**, if it exists and is not a line number.
-            - ✅ Example: `"1 Foreign tax credit ... |  |  | 1 | 5"` → `"foreign_tax_credit": 5`
-            - ❌ Do NOT return `1` as the value, that’s the line number, not data.
-            - ❌ If a field appears but there is no value after the last `|`, return `0` or `null`.
+        {EXTRACTION_RULES}
 
         FIELDS TO EXTRACT:
         {fields_description}
@@ -231,15 +390,22 @@ class TaxDocumentExtractor:
         ...
         }}
         """
+        model = "llama3-70b-8192"
+        temperature = 0.0
+        max_tokens = 800
+        cache_key = self.llm_cache.make_key(model, prompt, temperature, max_tokens=max_tokens)
         try:
-            response = self.groq_client.chat.completions.create(
-                model="llama3-70b-8192",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.0,
-                max_tokens=800
-            )
-            # print("raw_ouput",response.choices[0].message.content)
-            raw_output = response.choices[0].message.content.strip()
+            raw_output = self.llm_cache.get(cache_key)
+            from_cache = raw_output is not None
+            if not from_cache:
+                response = self.groq_client.chat.completions.create(
+                    model=model,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=temperature,
+                    max_tokens=max_tokens
+                )
+                # print("raw_ouput",response.choices[0].message.content)
+                raw_output = response.choices[0].message.content.strip()
             
             # Try extracting JSON block
             json_block_match = re.search(r"\{.*\}", raw_output, re.DOTALL)
@@ -247,209 +413,344 @@ class TaxDocumentExtractor:
                 raise ValueError("No JSON block found in LLM response.")
             
             parsed = json.loads(json_block_match.group(0))
+            # Only cache responses that parsed, so a bad completion is retried next time
+            if not from_cache:
+                self.llm_cache.set(cache_key, model, raw_output)
             return {field: parsed.get(field, 0) for field in field_list}
         
         except Exception as e:
             print(f"⚠️ LLM extraction error in {section_name}: {e}")
             return {field: 0 for field in field_list}
 
-    def extract_all_sections(self,text: str):
-        def extract_by_headers(start: str, end_pattern: str) -> str:
-            end_matches = re.findall(end_pattern, text)
-            if start in text and end_matches:
-                end_text = end_matches[-1]
-                return text[text.find(start):text.rfind(end_text) + len(end_text)]
-            return ""
-
-        year_pattern_schedules = r"\(Form 1040\)\s*\d{4}"
-        year_pattern_forms = r"\(\d{4}\)"
-
-        sections = {
-            "basic_info": re.search(r'(?s)Your first name and middle initial .*?(?=1a\s+)', text)
-                            or re.search(r'(?s)U.S. Individual Income Tax Return.*?(?=1a\s+)', text),
-            "income": re.search(r'(?s)TABLE:\sIncome \| 1a \| Total amount from Form.*?Form 1040', text)
-                      or re.search(r'(?s)(?:1[az]|W-2).*?15\s+[\d,\-]+', text),
-            "tax": re.search(r'(?s)TABLE:\sTax and\s*\|.*?total tax[\|\s\d\,]+', text)
-                    or re.search(r'(?s)Tax and\s+16.*?24\s+[\d,\-]+', text),
-            "payments": re.search(r'(?s)(?:Payments\s*\|)?\s*25\s*\|.*?37\s*\|.*?(?=38\s*\|)', text)
-                         or re.search(r'(?s)Payments\s+25.*?37\s+[\d,\-]+', text),
-
-            # Schedules and forms (with fallback)
-            "schedule_a": extract_by_headers("SCHEDULE A", f"Schedule A {year_pattern_schedules}"),
-            "schedule_b": extract_by_headers("SCHEDULE B", f"Schedule B {year_pattern_schedules}"),
-            "schedule_c": extract_by_headers("SCHEDULE C", f"Schedule C {year_pattern_schedules}"),
-            "schedule_d": extract_by_headers("SCHEDULE D", f"Schedule D {year_pattern_schedules}"),
-            "schedule_e": extract_by_headers("SCHEDULE E", f"Schedule E {year_pattern_schedules}"),
-            "schedule_f": extract_by_headers("SCHEDULE F", f"Schedule F {year_pattern_schedules}"),
-            "schedule_h": extract_by_headers("SCHEDULE H", f"Schedule H {year_pattern_schedules}"),
-            "schedule_j": extract_by_headers("SCHEDULE J", f"Schedule J {year_pattern_schedules}"),
-            "schedule_r": extract_by_headers("SCHEDULE R", f"Schedule R {year_pattern_schedules}"),
-            "schedule_se": extract_by_headers("SCHEDULE SE", f"Schedule SE {year_pattern_schedules}"),
-            "schedule_1": extract_by_headers("SCHEDULE 1", f"Schedule 1 {year_pattern_schedules}"),
-            "schedule_2": extract_by_headers("SCHEDULE 2", f"Schedule 2 {year_pattern_schedules}"),
-            "schedule_3": extract_by_headers("SCHEDULE 3", f"Schedule 3 {year_pattern_schedules}"),
-
-            "form_8949": extract_by_headers("Form Sales and Other Dispositions of Capital Assets", r"Form 8949 \(\d{4}\)|Form: 8949 \(\d{4}\)"),
-            "form_4868": extract_by_headers("Form 4868", f"Form 4868 {year_pattern_forms}"),
-            "form_8812": extract_by_headers("Form 8812", f"Form 8812 {year_pattern_forms}"),
-            "form_8829": extract_by_headers("Form 8829", f"Form 8829 {year_pattern_forms}"),
-            "schedule_eic": extract_by_headers("Schedule EIC", f"Schedule EIC {year_pattern_schedules}"),
-            "sign_here": extract_by_headers("Sign Under penalties of perjury", "Spouse's occupation"),
-            "paid_preparer": extract_by_headers("Preparer's signature", "Firm's EIN")
+    def _fields_description(self, field_list: List[str]) -> str:
+        return "\n".join(
+            [f"- {field}: {self.field_descriptions.get(field, field)}" for field in field_list]
+        )
+
+    def extract_batch_data_llm(self, batch, sections: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+        """
+        One LLM call for several (output key, section key, fields) entries, answered as JSON keyed by section.
+        The instruction block is sent once for the whole batch. If the batched response cannot be used,
+        its sections fall back to one call each.
+        """
+        section_keys = [section_key for _, section_key, _ in batch]
+        print(f"🔍 Parsing {len(batch)} sections via one LLM call: {', '.join(section_keys)}")
+        if not self.groq_client:
+            raise ValueError("Groq client not initialized. Set GROQ_API_KEY.")
+
+        sections_block = "\n\n".join(
+            self._section_block(section_key, sections[section_key], fields) for _, section_key, fields in batch
+        )
+        schema = {
+            "type": "object",
+            "properties": {section_key: self._section_schema(fields) for _, section_key, fields in batch},
+            "required": section_keys
         }
-        # print("basic_info", sections["basic_info"].group(0) if sections["basic_info"] else '')
-        sections["basic_info"]=sections["basic_info"].group(0) if sections["basic_info"] else ''
-        sections["income"]=sections["income"].group(0) if sections["income"] else ''
-        sections['tax']=sections["tax"].group(0) if sections["tax"] else ''
-        sections["payments"]=sections["payments"].group(0) if sections["payments"] else ''
-        extracted_data = {
-            "form_type": "Form 1040",
-            "tax_year":  re.search(r"Form 1040 Department of the Treasury-Internal Revenue Service (\d{4})", text).group(1),
-            "basic_info": self.extract_section_data_llm(
-                sections["basic_info"],
-                "basic_info",
-                ["taxpayer_name", "spouse_name", "ssn", "spouse_ssn", "address", "city", "state", "zip_code", "filing_status"]
-            ),
-            "income_section": self.extract_section_data_llm(
-                sections["income"],
-                "income", [
-                    "wages", "taxable_interest", "qualified_dividends", "ordinary_dividends",
-                    "capital_gains_or_loss", "total_income", "adjusted_gross_income",
-                    "standard_or_itemized_deduction", "total_deductions", "taxable_income"
-                ]
-            ),
-            "tax_section": self.extract_section_data_llm(
-                sections["tax"],
-                "tax", [
-                    "income_tax", "child_tax_credit", "other_credits", "total_credits",
-                    "additional_taxes", "total_tax"
-                ]
-            ),
-            "payment_section": self.extract_section_data_llm(
-                sections["payments"],
-                "payments", [
-                    "federal_withholding_w2", "federal_withholding_1099", "other_withholding",
-                    "federal_total_withholding", "estimated_payments", "total_payments",
-                    "refund", "amount_owed"
-                ]
-            ),
-            "schedule_1": self.extract_section_data_llm(
-                sections["schedule_1"],
-                "schedule_1", [
-                    "additional_income", "adjustments_to_income", "taxable_refunds", "alimony_received",
-                    "business_income", "capital_gain_loss", "other_gains_losses", "rental_income",
-                    "unemployment_compensation", "other_income", "educator_expenses", "business_expenses",
-                    "hsa_deduction", "moving_expenses", "se_tax_deduction", "sep_simple_ira",
-                    "self_employed_health", "penalty_early_withdrawal", "alimony_paid", "ira_deduction",
-                    "student_loan_interest"
-                ]
-            ),
-            "schedule_2": self.extract_section_data_llm(
-                sections["schedule_2"],
-                "schedule_2", [
-                    "amt", "excess_advance_ptc", "additional_taxes_other", "total_schedule_2"
-                ]
-            ),
-            "schedule_3": self.extract_section_data_llm(
-                sections["schedule_3"],
-                "schedule_3", [
-                    "foreign_tax_credit", "child_dependent_care_credit", "education_credits",
-                    "retirement_savings_credit", "residential_energy_credit", "other_nonrefundable_credits",
-                    "total_other_credits", "net_ptc", "amount_paid_extension", "excess_ss_tax",
-                    "credit_tax_paid_forms", "other_payments", "total_other_payments"
-                ]
-            ),
-            "schedule_a": self.extract_section_data_llm(
-                sections["schedule_a"],
-                "schedule_a", [
-                    "medical_dental", "state_local_income_tax", "state_local_sales_tax", "real_estate_tax",
-                    "personal_property_tax", "other_taxes", "home_mortgage_interest", "home_mortgage_points",
-                    "mortgage_insurance_premiums", "investment_interest", "charitable_cash", "charitable_noncash",
-                    "charitable_carryover", "casualty_theft_losses", "other_itemized", "total_itemized"
-                ]
-            ),
-            "schedule_b": self.extract_section_data_llm(
-                sections["schedule_b"],
-                "schedule_b", [
-                    "total_interest", "total_dividends", "foreign_accounts", "foreign_trust"
-                ]
-            ),
-            "schedule_c": self.extract_section_data_llm(
-                sections["schedule_c"],
-                "schedule_c", [
-                    "gross_receipts", "returns_allowances", "cost_of_goods_sold", "gross_profit",
-                    "total_expenses", "net_profit_loss"
-                ]
-            ),
-            "schedule_d": self.extract_section_data_llm(
-                sections["schedule_d"],
-                "schedule_d", [
-                    "short_term_gain_loss", "long_term_gain_loss", "total_capital_gain_loss",
-                    "capital_gain_distributions", "unrecaptured_section_1250", "collectibles_gain"
-                ]
-            ),
-            "schedule_e": self.extract_section_data_llm(
-                sections["schedule_e"],
-                "schedule_e", [
-                    "rental_real_estate_income", "royalty_income", "partnership_s_corp_income",
-                    "estate_trust_income", "total_supplemental_income"
-                ]
-            ),
-            "schedule_f": self.extract_section_data_llm(
-                sections["schedule_f"],
-                "schedule_f", [
-                    "gross_farm_income", "farm_expenses", "net_farm_profit_loss"
-                ]
-            ),
-            "schedule_h": self.extract_section_data_llm(
-                sections["schedule_h"],
-                "schedule_h", [
-                    "household_wages", "household_ss_medicare", "household_futa", "total_household_tax"
-                ]
-            ),
-            "schedule_j": self.extract_section_data_llm(
-                sections["schedule_j"],
-                "schedule_j", [
-                    "elected_farm_income", "average_income"
-                ]
-            ),
-            "schedule_r": self.extract_section_data_llm(
-                sections["schedule_r"],
-                "schedule_r", [
-                    "credit_elderly_disabled"
-                ]
-            ),
-            "schedule_se": self.extract_section_data_llm(
-                sections["schedule_se"],
-                "schedule_se", [
-                    "net_earnings_se", "self_employment_tax", "deductible_se_tax"
-                ]
-            ),
-            "form_4868": self.extract_section_data_llm(
-                sections["form_4868"],
-                "form_4868", [
-                    "extension_payment"
-                ]
-            ),
-            "form_8812": self.extract_section_data_llm(
-                sections["form_8812"],
-                "form_8812", [
-                    "additional_child_tax_credit", "earned_income"
-                ]
-            ),
-            "form_8829": self.extract_section_data_llm(
-                sections["form_8829"],
-                "form_8829", [
-                    "home_office_area", "total_home_area", "home_office_percentage", "home_office_deduction"
-                ]
+        prompt = f"""
+        {EXTRACTION_RULES}
+        - Several sections follow, each named by its SECTION line. Extract each section's fields from that section's text only.
+
+        {sections_block}
+
+        Return one JSON object keyed by section name, matching this JSON schema:
+        {json.dumps(schema)}
+        """
+        model = "llama3-70b-8192"
+        temperature = 0.0
+        max_tokens = max(800, OUTPUT_TOKENS_PER_FIELD * sum(len(fields) for _, _, fields in batch))
+        response_format = {"type": "json_object"}
+        cache_key = self.llm_cache.make_key(
+            model, prompt, temperature, max_tokens=max_tokens, response_format=response_format
+        )
+        try:
+            raw_output = self.llm_cache.get(cache_key)
+            from_cache = raw_output is not None
+            if not from_cache:
+                response = self.groq_client.chat.completions.create(
+                    model=model,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    response_format=response_format
+                )
+                raw_output = response.choices[0].message.content.strip()
+
+            json_block_match = re.search(r"\{.*\}", raw_output, re.DOTALL)
+            if not json_block_match:
+                raise ValueError("No JSON block found in LLM response.")
+            parsed = json.loads(json_block_match.group(0))
+            missing = [section_key for section_key in section_keys if not isinstance(parsed.get(section_key), dict)]
+            if missing:
+                raise ValueError(f"Batched response has no object for {missing}")
+            if not from_cache:
+                self.llm_cache.set(cache_key, model, raw_output)
+            return {
+                output_key: {field: parsed[section_key].get(field, 0) for field in fields}
+                for output_key, section_key, fields in batch
+            }
+
+        except Exception as e:
+            print(f"⚠️ Batched LLM extraction error for {', '.join(section_keys)}, retrying one call per section: {e}")
+            return {
+                output_key: self.extract_section_chunks_llm(sections[section_key], section_key, fields)
+                for output_key, section_key, fields in batch
+            }
+
+    def _section_block(self, section_key: str, section_text: str, fields: List[str]) -> str:
+        return (
+            f"SECTION: {section_key}\nFIELDS TO EXTRACT:\n{self._fields_description(fields)}\n"
+            f"SECTION START\n{section_text}\nSECTION END"
+        )
+
+    @staticmethod
+    def _section_schema(fields: List[str]) -> Dict[str, Any]:
+        return {
+            "type": "object",
+            "properties": {field: {"type": ["number", "string", "null"]} for field in fields},
+            "required": fields
+        }
+
+    def extract_section_chunks_llm(self, section_text: str, section_name: str, field_list: List[str]) -> Dict[str, Any]:
+        """
+        extract_section_data_llm for a section of any size: text over LLM_SECTION_TOKEN_BUDGET is split into
+        chunks of whole lines, one call each, and a field takes the first non-zero value any chunk found
+        """
+        chunks = compaction.split_section(section_text, config.LLM_SETTINGS.get("section_token_budget", 3000))
+        if len(chunks) == 1:
+            return self.extract_section_data_llm(section_text, section_name, field_list)
+        print(f"✂️ {section_name} is over the section token budget, extracting it in {len(chunks)} parts")
+        parts = [
+            self.extract_section_data_llm(chunk, f"{section_name} (part {number})", field_list)
+            for number, chunk in enumerate(chunks, 1)
+        ]
+        return {
+            field: next((part[field] for part in parts if part[field] not in (None, 0, "")), parts[0][field])
+            for field in field_list
+        }
+
+    def plan_llm_batches(self, calls, sections: Dict[str, str]):
+        """
+        Group (output key, section key, fields) calls into batches under LLM_BATCH_TOKEN_BUDGET tokens.
+        A call costs its section block and schema in the prompt plus the answer tokens reserved for its fields.
+        Sections are packed largest first into the first batch with room (first-fit decreasing); a section
+        bigger than half the budget keeps a call of its own. Returns a list of call lists.
+        """
+        budget = config.LLM_SETTINGS.get("batch_token_budget", 6000) - token_budget.count_tokens(EXTRACTION_RULES)
+        sized = sorted(
+            (
+                (
+                    token_budget.count_tokens(self._section_block(section_key, sections[section_key], fields))
+                    + token_budget.count_tokens(json.dumps(self._section_schema(fields)))
+                    + OUTPUT_TOKENS_PER_FIELD * len(fields),
+                    (output_key, section_key, fields)
+                )
+                for output_key, section_key, fields in calls
             ),
-            "schedule_eic": self.extract_section_data_llm(
-                sections["schedule_eic"],
-                "schedule_eic", [
-                    "earned_income_credit", "qualifying_children_eic"
-                ]
+            key=lambda item: item[0],
+            reverse=True
+        )
+        solo, batches = [], []
+        for tokens, call in sized:
+            if tokens > budget // 2:
+                solo.append([call])
+                continue
+            for batch in batches:
+                if batch[0] + tokens <= budget:
+                    batch[0] += tokens
+                    batch[1].append(call)
+                    break
+            else:
+                batches.append([tokens, [call]])
+        return solo + [batch_calls for _, batch_calls in batches]
+
+    def _run_llm_batch(self, batch, sections: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+        if len(batch) == 1:
+            output_key, section_key, fields = batch[0]
+            return {output_key: self.extract_section_chunks_llm(sections[section_key], section_key, fields)}
+        return self.extract_batch_data_llm(batch, sections)
+
+    def plan_section_calls(self, text: str, sections: Dict[str, str]):
+        """
+        Decide which SECTION_FIELDS entries actually need an LLM call.
+        Core Form 1040 sections are always extracted; schedules and forms are skipped when
+        their section text is empty. A schedule detected in the document that we failed to slice
+        is still extracted, from the text starting at its first detected header (see _slice_from_header),
+        and that slice is stored in sections.
+        """
+        detected_schedules, detected_forms = LLMOptimizedTextractExtractor.detect_all_schedules(text)
+        detected = {("schedules", key): info for key, info in detected_schedules.items()}
+        detected.update({("forms", key): info for key, info in detected_forms.items()})
+
+        planned, skipped = [], []
+        for entry in SECTION_FIELDS:
+            output_key, section_key, fields = entry
+            if section_key in CORE_SECTIONS or sections.get(section_key, "").strip():
+                planned.append(entry)
+                continue
+            detection_key = SECTION_DETECTION_KEYS.get(section_key)
+            if detection_key in detected:
+                print(f"⚠️ {section_key} detected in document but no section text was sliced, "
+                      f"extracting from its header")
+                sections[section_key] = self._slice_from_header(text, detection_key, detected)
+                planned.append(entry)
+                continue
+            skipped.append(entry)
+
+        print(f"🧭 Extraction plan: {len(planned)} LLM calls, {len(skipped)} absent sections skipped")
+        return planned, skipped
+
+    @staticmethod
+    def _slice_from_header(text, detection_key, detected):
+        """
+        Text from the first detected header of detection_key up to the next header of another detected
+        schedule or form, at most sectioning.SECTION_WINDOW_CHARS long
+        """
+        start = detected[detection_key]["offsets"][0]
+        later_headers = [
+            offset for key, info in detected.items() if key != detection_key
+            for offset in info["offsets"] if offset > start
+        ]
+        end = min(later_headers + [len(text), start + sectioning.SECTION_WINDOW_CHARS])
+        return text[start:end]
+
+    def resolve_fields_directly(self, sections: Dict[str, str], planned, line_confidences=None, *, tax_year):
+        """
+        Fill fields from table rows and Textract key-value pairs, without the LLM.
+        Table rows are only read by line number for returns of SECTION_LINE_NUMBER_TAX_YEARS; tax_year is
+        required so no caller loses the line-number reads by accident, and other years (or None, when the
+        return's year is unknown) send those fields to the LLM.
+        With a line -> confidence index, a value is kept only when the lines it was read from reach
+        min_field_confidence; the rest go back to the LLM. Returns (values, confidences, origins) per output
+        key, where a confidence is None when the index has no entry for the value's lines and an origin is
+        "table" or "kv" for the parser the value came from.
+        """
+        threshold = config.LLM_SETTINGS.get("min_field_confidence", 90)
+        line_numbers_apply = str(tax_year) in SECTION_LINE_NUMBER_TAX_YEARS
+        if not line_numbers_apply:
+            print(f"📅 No Form 1040 line map for tax year {tax_year}, leaving line items to the LLM")
+        resolved, confidences, origins = {}, {}, {}
+        rejected = 0
+        for output_key, section_key, fields in planned:
+            sources = {}
+            kv_values = self.kv_index.resolve(sections[section_key], fields, sources)
+            table_values = table_rows.resolve_fields(
+                sections[section_key], SECTION_LINE_NUMBERS.get(section_key) if line_numbers_apply else None, sources
             )
+            values = {**kv_values, **table_values}
+            resolved[output_key], confidences[output_key], origins[output_key] = {}, {}, {}
+            for field, value in values.items():
+                line_scores = [
+                    line_confidences[line] for line in sources[field]
+                    if line_confidences is not None and line in line_confidences
+                ]
+                confidence = min(line_scores) if line_scores else None
+                if confidence is not None and confidence < threshold:
+                    rejected += 1
+                    continue
+                resolved[output_key][field] = value
+                confidences[output_key][field] = confidence
+                origins[output_key][field] = "table" if field in table_values else "kv"
+        if rejected:
+            print(f"🎯 {rejected} directly read fields below {threshold}% Textract confidence, sending them to the LLM")
+        return resolved, confidences, origins
+
+    def extract_sections_llm(self, sections: Dict[str, str], concurrent: bool = True, planned=None,
+                             line_confidences=None, batch=None, *, tax_year) -> Dict[str, Any]:
+        """
+        Run the per-section LLM extraction for the planned SECTION_FIELDS entries (all of them by default).
+        Fields whose form line appears in a table row, or whose form key matches a Textract key-value pair,
+        are filled directly when their Textract confidence allows (line numbers only for tax years the line map
+        covers, so tax_year is required; pass None when the return's year is unknown), and the LLM is asked only
+        for the rest.
+        Sections are compacted before they are sent (LLM_COMPACT_SECTIONS) and split when still over budget.
+        With batch (LLM_BATCH_SECTIONS by default), small sections share one prompt under the token budget.
+        In concurrent mode the requests go out together through a thread pool capped at max_concurrency.
+        Sections left out of the plan are filled with null values without an LLM call.
+        The result also carries "field_confidence": the Textract confidence behind every directly read field,
+        None for fields that came from the LLM or have no recorded confidence, and "field_source": where each
+        value came from ("table", "kv" or "llm"; None for sections left out of the plan).
+        """
+        planned = SECTION_FIELDS if planned is None else planned
+        resolved, confidences, origins = self.resolve_fields_directly(
+            sections, planned, line_confidences, tax_year=tax_year
+        )
+        calls = [
+            (output_key, section_key, [field for field in fields if field not in resolved[output_key]])
+            for output_key, section_key, fields in planned
+        ]
+        calls = [call for call in calls if call[2]]
+        print(f"🧮 Table rows and key-value pairs resolved {sum(len(fields) for fields in resolved.values())} fields, "
+              f"{len(planned) - len(calls)} of {len(planned)} LLM calls avoided")
+
+        # Only the prompts see the compacted text; the returned sections and direct reads use it as sliced
+        prompt_sections = {section_key: sections[section_key] for _, section_key, _ in calls}
+        if calls and config.LLM_SETTINGS.get("compact_sections", True):
+            before = sum(token_budget.count_tokens(section_text) for section_text in prompt_sections.values())
+            prompt_sections = {
+                section_key: compaction.compact_section(section_text)
+                for section_key, section_text in prompt_sections.items()
+            }
+            after = sum(token_budget.count_tokens(section_text) for section_text in prompt_sections.values())
+            print(f"🗜️ Compacted {len(prompt_sections)} sections from {before} to {after} tokens")
+
+        if batch is None:
+            batch = config.LLM_SETTINGS.get("batch_sections", True)
+        batches = self.plan_llm_batches(calls, prompt_sections) if batch else [[call] for call in calls]
+        if batch and len(batches) < len(calls):
+            print(f"📦 Batched {len(calls)} LLM calls into {len(batches)} requests")
+
+        results = {}
+        if batches and (not concurrent or self.max_concurrency <= 1):
+            for llm_batch in batches:
+                results.update(self._run_llm_batch(llm_batch, prompt_sections))
+        elif batches:
+            with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(batches))) as pool:
+                futures = [pool.submit(self._run_llm_batch, llm_batch, prompt_sections) for llm_batch in batches]
+                for future in futures:
+                    results.update(future.result())
+
+        # Rebuild in SECTION_FIELDS order so the result keeps the sequential layout
+        extracted = {
+            output_key: {
+                field: resolved[output_key][field] if field in resolved[output_key] else results[output_key][field]
+                for field in fields
+            } if output_key in resolved else {field: None for field in fields}
+            for output_key, section_key, fields in SECTION_FIELDS
+        }
+        extracted["field_confidence"] = {
+            output_key: {field: confidences.get(output_key, {}).get(field) for field in fields}
+            for output_key, section_key, fields in SECTION_FIELDS
+        }
+        extracted["field_source"] = {
+            output_key: {
+                field: origins[output_key].get(field, "llm") if output_key in origins else None for field in fields
+            }
+            for output_key, section_key, fields in SECTION_FIELDS
+        }
+        return extracted
+
+    def extract_all_sections(self,text: str, concurrent: bool = True, line_confidences=None):
+        sections, timings = sectioning.extract_sections(text)
+        print(f"✂️ Sectioned {len(text)} chars in {timings['total'] * 1000:.1f} ms "
+              f"(page index {timings['pages'] * 1000:.1f} ms, slicing {timings['slice'] * 1000:.1f} ms, "
+              f"{timings['fallback_sections']} sections searched document-wide)")
+        slowest = next(iter(pattern_registry.registry.stats().items()), None)
+        if slowest:
+            name, counters = slowest
+            print(f"⏱️ Slowest section pattern so far: {name} ({counters['total_ms']} ms over {counters['calls']} calls, "
+                  f"{counters['timeouts']} timeouts)")
+        extracted_data = {
+            "form_type": "Form 1040",
+            "tax_year":  re.search(r"1040 Department of the Treasury-Internal Revenue Service (\d{4})", text).group(1),
         }
+        planned, _ = self.plan_section_calls(text, sections)
+        extracted_data.update(self.extract_sections_llm(
+            sections, concurrent=concurrent, planned=planned, line_confidences=line_confidences,
+            tax_year=extracted_data["tax_year"]
+        ))
+        cache_stats = self.llm_cache.stats()
+        print(f"🗄️ LLM cache so far: {cache_stats['hits']} hits, {cache_stats['misses']} misses "
+              f"({cache_stats['hit_rate']:.0%} hit rate, {cache_stats['entries']} entries)")
         return extracted_data,sections
 
 
@@ -459,7 +760,9 @@ def field_map(raw_text_path, session_id):
         content = f.read()
 
     extractor = TaxDocumentExtractor()
-    result, sectioned_data = extractor.extract_all_sections(content)
+    # Saved by extract_data alongside the text; absent for text produced without Textract confidences
+    line_confidences = load_line_confidences(session_id)
+    result, sectioned_data = extractor.extract_all_sections(content, line_confidences=line_confidences)
 
     json_name = f'{session_id}_fields.json'
     json_path = config.PATHS.get("json_data_path", "")
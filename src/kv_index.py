@@ -0,0 +1,173 @@
+import re
+from rapidfuzz import fuzz, process, utils
+from src import config
+
+# Field -> the key phrasings Form 1040 prints for it. Textract keys usually carry the whole printed label
+# ("Home address (number and street). If you have a P.O. box, see instructions."), so keys are compared
+# on their leading characters only
+FORM_KEY_PHRASES = {
+    "taxpayer_name": ["Your first name and middle initial"],
+    "spouse_name": ["If joint return, spouse's first name and middle initial", "Spouse's first name and middle initial"],
+    "ssn": ["Your social security number"],
+    "spouse_ssn": ["Spouse's social security number"],
+    "address": ["Home address (number and street)"],
+    "apartment": ["Apt. no."],
+    "city": ["City, town, or post office", "City, town or post office"],
+    "state": ["State"],
+    "zip_code": ["ZIP code"],
+}
+LAST_NAME_PHRASES = ["Last name"]
+# Phrases too short to match on a prefix ("State" would also match "State wages"); the whole key must match
+EXACT_KEY_PHRASES = {"State"}
+
+# Filing status value (as the LLM prompt names it) -> checkbox labels; the single checked box wins
+FILING_STATUS_PHRASES = {
+    "Single": ["Single"],
+    "Married Filing Jointly": ["Married filing jointly"],
+    "Married Filing Separately": ["Married filing separately"],
+    "Head of Household": ["Head of household"],
+    "Qualifying Widow(er)": ["Qualifying surviving spouse", "Qualifying widow(er)"],
+}
+
+# A matched key whose value fails its field's check is ignored rather than trusted
+FIELD_VALUE_PATTERNS = {
+    "ssn": re.compile(r"^\d{3}-?\d{2}-?\d{4}$"),
+    "spouse_ssn": re.compile(r"^\d{3}-?\d{2}-?\d{4}$"),
+    "state": re.compile(r"^[A-Z]{2}$"),
+    "zip_code": re.compile(r"^\d{5}(?:-\d{4})?$"),
+}
+CHECKBOX_VALUES = ("[X]", "[ ]")
+
+
+def _normalise(text):
+    return " ".join(utils.default_process(text).split())
+
+
+_EXACT_KEY_PHRASES = {_normalise(phrase) for phrase in EXACT_KEY_PHRASES}
+
+
+def _prefix_ratio(key, phrase, **kwargs):
+    compared = key if phrase in _EXACT_KEY_PHRASES else key[:len(phrase)]
+    return fuzz.ratio(compared, phrase, score_cutoff=kwargs.get("score_cutoff"))
+
+
+def key_value_pairs(section_text):
+    """
+    (key, value) pairs in document order: table cells paired with the cell below them, then "key: value" lines
+    Form tables alternate label and entry rows (and a section can start part-way through one), so every row is
+    paired with the next; table pairs come back as one list per row so cells of the same row stay together.
+    Each row / pair also carries the text lines it was read from.
+    """
+    table_rows, line_pairs = [], []
+    lines = section_text.splitlines()
+    for position, line in enumerate(lines):
+        stripped = line.strip()
+        if "|" in stripped:
+            if position + 1 < len(lines) and "|" in lines[position + 1]:
+                headers, values = line.split("|"), lines[position + 1].split("|")
+                if len(headers) == len(values):
+                    table_rows.append((
+                        [(header.strip(), value.strip()) for header, value in zip(headers, values)],
+                        [stripped, lines[position + 1].strip()]
+                    ))
+        elif ": " in stripped:
+            key, value = stripped.split(": ", 1)
+            line_pairs.append((key, value.strip(), stripped))
+    return table_rows, line_pairs
+
+
+class KeyValueIndex:
+    """
+    Fuzzy index from extractor fields to the form key phrasings Textract returns in KEY_VALUE_SET pairs
+    Built once from field_descriptions; fields without known phrasings are left to the LLM
+    """
+
+    def __init__(self, field_descriptions, threshold=None):
+        self.threshold = threshold if threshold is not None else config.LLM_SETTINGS.get("kv_match_threshold", 90)
+        self.phrases, self.phrase_fields = [], []
+        for field in list(field_descriptions) + ["apartment"]:
+            for phrase in FORM_KEY_PHRASES.get(field, ()):
+                self.phrases.append(_normalise(phrase))
+                self.phrase_fields.append(field)
+        self.last_name_phrases = [_normalise(phrase) for phrase in LAST_NAME_PHRASES]
+        self.status_phrases, self.statuses = [], []
+        if "filing_status" in field_descriptions:
+            for status, phrases in FILING_STATUS_PHRASES.items():
+                for phrase in phrases:
+                    self.status_phrases.append(_normalise(phrase))
+                    self.statuses.append(status)
+
+    def match(self, key, phrases):
+        """
+        Index of the phrase the key starts with (allowing OCR noise), or None below the threshold
+        """
+        if not phrases:
+            return None
+        best = process.extractOne(
+            _normalise(key), phrases, scorer=_prefix_ratio, processor=None, score_cutoff=self.threshold
+        )
+        return best[2] if best else None
+
+    def _field(self, key):
+        index = self.match(key, self.phrases)
+        return self.phrase_fields[index] if index is not None else None
+
+    def _accept(self, found, found_sources, field, value, source_lines):
+        # An empty value is as likely an OCR or geometry miss as a blank entry, so the LLM gets to look
+        if field in found or not value or value in CHECKBOX_VALUES:
+            return
+        pattern = FIELD_VALUE_PATTERNS.get(field)
+        if pattern and not pattern.match(value):
+            return
+        found[field] = value
+        found_sources[field] = source_lines
+
+    def resolve(self, section_text, fields, sources=None):
+        """
+        Fields filled from confidently matched key-value pairs; the first valid pair per field wins.
+        Matched keys with an empty value are skipped, leaving the field to the LLM.
+        A sources dict receives, per resolved field, the list of text lines its value was read from.
+        """
+        wanted = set(fields)
+        if not section_text or not wanted & (set(self.phrase_fields) | {"filing_status"}):
+            return {}
+        table_rows, line_pairs = key_value_pairs(section_text)
+        found, found_sources = {}, {}
+
+        for row, row_lines in table_rows:
+            row_fields = [self._field(header) for header, _ in row]
+            for (header, value), field in zip(row, row_fields):
+                if field is None:
+                    continue
+                if field in ("taxpayer_name", "spouse_name"):
+                    # Names are split over a first-name cell and the "Last name" cell of the same row
+                    last_names = [
+                        last for other, last in row if self.match(other, self.last_name_phrases) is not None
+                    ]
+                    value = " ".join(part for part in [value] + last_names[:1] if part)
+                self._accept(found, found_sources, field, value, row_lines)
+
+        checked, checked_lines = [], []
+        for key, value, line in line_pairs:
+            if value in CHECKBOX_VALUES:
+                status = self.match(key, self.status_phrases)
+                if status is not None and value == "[X]":
+                    checked.append(self.statuses[status])
+                    checked_lines.append(line)
+                continue
+            field = self._field(key)
+            # Names need their "Last name" partner, which only the table rows tie together
+            if field is not None and field not in ("taxpayer_name", "spouse_name"):
+                self._accept(found, found_sources, field, value, [line])
+        if len(set(checked)) == 1:
+            found["filing_status"] = checked[0]
+            found_sources["filing_status"] = checked_lines
+
+        apartment = found.pop("apartment", "")
+        if apartment and found.get("address"):
+            found["address"] = f"{found['address']}, Apt. {apartment}"
+            found_sources["address"] = found_sources["address"] + found_sources["apartment"]
+        resolved = {field: value for field, value in found.items() if field in wanted}
+        if sources is not None:
+            sources.update((field, found_sources[field]) for field in resolved)
+        return resolved
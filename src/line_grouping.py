@@ -0,0 +1,61 @@
+import numpy as np
+
+DEFAULT_LINE_TOLERANCE = 0.01
+
+
+def adaptive_line_tolerance(heights, factor=0.75, default=DEFAULT_LINE_TOLERANCE):
+    """
+    Line tolerance from word-height statistics: three quarters of the median word height on the page
+    Falls back to the fixed default when no usable heights are available
+    """
+    heights = np.asarray(heights, dtype=float)
+    heights = heights[heights > 0]
+    if not heights.size:
+        return default
+    return float(np.median(heights)) * factor
+
+
+def group_line_indexes(tops, lefts, line_tolerance=DEFAULT_LINE_TOLERANCE):
+    """
+    Cluster elements into lines and order each line left to right
+    Elements are sorted by (top, left); a line starts at the first element more than line_tolerance below the
+    top of the previous line's first element. Returns a list of (line top, element indexes in reading order).
+    """
+    tops = np.asarray(tops, dtype=float)
+    lefts = np.asarray(lefts, dtype=float)
+    count = tops.size
+    if not count:
+        return []
+
+    # Stable sort by (top, left) keeps the original order for exact ties
+    order = np.lexsort((lefts, tops))
+    sorted_tops = tops[order]
+
+    # Each line is anchored on its first element, so line starts are found with one binary search per line
+    # rather than a Python step per element. The search bound is re-checked with the same subtraction the
+    # tolerance test uses so floating-point rounding cannot move an element into a different line.
+    line_starts = [0]
+    start = 0
+    while True:
+        anchor = sorted_tops[start]
+        end = int(np.searchsorted(sorted_tops, anchor + line_tolerance, side='right'))
+        while end < count and sorted_tops[end] - anchor <= line_tolerance:
+            end += 1
+        while end - 1 > start and sorted_tops[end - 1] - anchor > line_tolerance:
+            end -= 1
+        if end >= count:
+            break
+        line_starts.append(end)
+        start = end
+
+    line_ids = np.zeros(count, dtype=np.intp)
+    line_ids[line_starts[1:]] = 1
+    line_ids = np.cumsum(line_ids)
+
+    # Within a line, order by left; ties keep their (top, left) position
+    in_line_order = order[np.lexsort((np.arange(count), lefts[order], line_ids))]
+    bounds = line_starts + [count]
+    return [
+        (float(sorted_tops[bounds[line]]), in_line_order[bounds[line]:bounds[line + 1]])
+        for line in range(len(line_starts))
+    ]
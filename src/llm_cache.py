@@ -0,0 +1,115 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from contextlib import closing
+from src import config
+
+
+class LLMResponseCache:
+    """
+    On-disk SQLite cache for raw LLM responses, keyed by a hash of model id + rendered prompt + the request
+    parameters that shape the answer (temperature, max_tokens, response_format).
+    Entries expire after max_age_seconds and the least recently used ones are evicted past max_entries.
+    """
+
+    def __init__(self, db_path=None, max_entries=None, max_age_seconds=None):
+        self.db_path = db_path or config.PATHS.get("llm_cache_path", "")
+        self.max_entries = max_entries or config.LLM_SETTINGS.get("cache_max_entries", 5000)
+        self.max_age_seconds = max_age_seconds or config.LLM_SETTINGS.get("cache_max_age_seconds", 30 * 24 * 3600)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS llm_responses (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_accessed REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_responses_last_accessed ON llm_responses (last_accessed)")
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    @staticmethod
+    def make_key(model, prompt, temperature, max_tokens=None, response_format=None):
+        payload = (
+            f"{model}\x00{float(temperature)!r}\x00{max_tokens!r}\x00"
+            f"{json.dumps(response_format, sort_keys=True)}\x00{prompt}"
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """
+        Return the cached response for key, or None on a miss or an expired entry
+        """
+        now = time.time()
+        with self._lock, closing(self._connect()) as conn, conn:
+            row = conn.execute(
+                "SELECT response, created_at FROM llm_responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row and now - row[1] <= self.max_age_seconds:
+                conn.execute("UPDATE llm_responses SET last_accessed = ? WHERE key = ?", (now, key))
+                self.hits += 1
+                return row[0]
+            if row:
+                conn.execute("DELETE FROM llm_responses WHERE key = ?", (key,))
+            self.misses += 1
+            return None
+
+    def set(self, key, model, response):
+        now = time.time()
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_responses (key, model, response, created_at, last_accessed) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, model, response, now, now)
+            )
+            self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        """
+        Drop expired entries, then trim the least recently used ones down to max_entries
+        """
+        conn.execute("DELETE FROM llm_responses WHERE created_at < ?", (now - self.max_age_seconds,))
+        conn.execute(
+            "DELETE FROM llm_responses WHERE key IN ("
+            "SELECT key FROM llm_responses ORDER BY last_accessed DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+    def stats(self):
+        with self._lock, closing(self._connect()) as conn:
+            entries = conn.execute("SELECT COUNT(*) FROM llm_responses").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries
+        }
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_llm_cache():
+    """
+    Process-wide cache instance so hit/miss counters survive across extractor instances
+    """
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = LLMResponseCache()
+        return _shared_cache
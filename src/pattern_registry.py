@@ -0,0 +1,141 @@
+import re
+import time
+import threading
+import regex
+from src import config
+
+# Guards the timing counters, which are updated from the LLM / sectioning worker threads
+_counter_lock = threading.Lock()
+
+
+class RegisteredPattern:
+    """
+    A precompiled `regex` pattern that runs under a time budget and keeps timing counters.
+    When the budget runs out the optional fallback pattern (a cheaper variant) is tried instead;
+    if that times out as well the call returns no match rather than stalling the request.
+    A window limits every call to that many characters after its start position. With plain=True the
+    pattern is compiled with the stdlib `re` engine, which has no time budget; only linear-time
+    patterns (literals, simple alternations) should be given it.
+    """
+
+    def __init__(self, name, pattern, flags=0, fallback=None, timeout=None, registry=None, window=None,
+                 plain=False):
+        self.name = name
+        self.pattern = pattern
+        self.compiled = re.compile(pattern, flags) if plain else regex.compile(pattern, flags)
+        self.fallback = fallback
+        self.timeout = timeout
+        self.registry = registry
+        self.window = window
+        self.plain = plain
+        self.calls = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.timeouts = 0
+        self.fallbacks = 0
+
+    def _budget(self):
+        if self.timeout is not None:
+            return self.timeout
+        return self.registry.timeout if self.registry else None
+
+    def _run(self, method, empty, string, pos, endpos):
+        pos = pos or 0
+        if self.window is not None:
+            endpos = min(endpos if endpos is not None else len(string), pos + self.window)
+        args = (string, pos) if endpos is None else (string, pos, endpos)
+        kwargs = {} if self.plain else {"timeout": self._budget()}
+        started = time.perf_counter()
+        try:
+            if method == "finditer":
+                # Materialise inside the budget; a lazy iterator would only time out while being consumed
+                return list(self.compiled.finditer(*args, **kwargs))
+            return getattr(self.compiled, method)(*args, **kwargs)
+        except TimeoutError:
+            with _counter_lock:
+                self.timeouts += 1
+                self.fallbacks += self.fallback is not None
+            if self.fallback is not None:
+                print(f"⏱️ Pattern {self.name} ran out of time, falling back to {self.fallback.name}")
+                return self.fallback._run(method, empty, string, pos, endpos)
+            print(f"⏱️ Pattern {self.name} ran out of time, treating it as no match")
+            return empty
+        finally:
+            elapsed = time.perf_counter() - started
+            with _counter_lock:
+                self.calls += 1
+                self.seconds += elapsed
+                self.max_seconds = max(self.max_seconds, elapsed)
+
+    def search(self, string, pos=None, endpos=None):
+        return self._run("search", None, string, pos, endpos)
+
+    def match(self, string, pos=None, endpos=None):
+        return self._run("match", None, string, pos, endpos)
+
+    def findall(self, string, pos=None, endpos=None):
+        return self._run("findall", [], string, pos, endpos)
+
+    def finditer(self, string, pos=None, endpos=None):
+        return self._run("finditer", [], string, pos, endpos)
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "total_ms": round(self.seconds * 1000, 3),
+            "max_ms": round(self.max_seconds * 1000, 3),
+            "timeouts": self.timeouts,
+            "fallbacks": self.fallbacks,
+        }
+
+
+class PatternRegistry:
+    """
+    Named, precompiled patterns sharing one default time budget (REGEX_TIMEOUT_SECONDS)
+    """
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout if timeout is not None else config.REGEX_SETTINGS.get("timeout_seconds", 2.0)
+        self.patterns = {}
+
+    def register(self, name, pattern, flags=0, fallback=None, timeout=None, fallback_window=None,
+                 fallback_plain=False):
+        """
+        Compile and register a pattern with an optional cheaper variant tried when it times out:
+        fallback is a pattern string (default: the pattern itself), fallback_window limits the retry to that many
+        characters after the start position and fallback_plain runs it on the stdlib `re` engine
+        """
+        fallback_pattern = None
+        if fallback is not None or fallback_window is not None or fallback_plain:
+            fallback_pattern = RegisteredPattern(
+                f"{name}:fallback", fallback if fallback is not None else pattern, flags, None, timeout, self,
+                window=fallback_window, plain=fallback_plain
+            )
+        registered = RegisteredPattern(name, pattern, flags, fallback_pattern, timeout, self)
+        self.patterns[name] = registered
+        return registered
+
+    def __getitem__(self, name):
+        return self.patterns[name]
+
+    def stats(self):
+        """
+        Per-pattern counters, slowest patterns first
+        """
+        counters = {}
+        for name, registered in self.patterns.items():
+            counters[name] = registered.stats()
+            if registered.fallback is not None and registered.fallback.calls:
+                counters[registered.fallback.name] = registered.fallback.stats()
+        return dict(sorted(counters.items(), key=lambda item: item[1]["total_ms"], reverse=True))
+
+    def reset_stats(self):
+        with _counter_lock:
+            for registered in self.patterns.values():
+                for counted in (registered, registered.fallback):
+                    if counted is not None:
+                        counted.calls = counted.timeouts = counted.fallbacks = 0
+                        counted.seconds = counted.max_seconds = 0.0
+
+
+registry = PatternRegistry()
@@ -0,0 +1,149 @@
+import os
+import re
+import uuid
+import fitz
+from src import config
+
+# Dot leaders (". . . .") between a line label and its amount carry no information
+LEADER_PATTERN = re.compile(r"^[.…·]+$")
+
+# Textract reports typographic dashes and quotes as plain ASCII; match it so the sectioning regexes keep working
+TEXTRACT_CHARACTERS = str.maketrans({"—": "-", "–": "-", "‘": "'", "’": "'", "“": '"', "”": '"'})
+
+# Headers, footers and titles of the forms extract_all_sections maps; e-file status pages, Form 9325
+# acknowledgements, cover letters and state returns match none of these and never reach sectioning
+RELEVANT_PAGE_PATTERN = re.compile(
+    r"1040 Department of the Treasury"
+    r"|Form 1040 \(\d{4}\)"
+    r"|U\.S\. Individual Income Tax Return"
+    r"|SCHEDULE (?:[A-Z]{1,2}|[123]|8812|EIC)\b"
+    r"|Schedule (?:[A-Z]{1,2}|[123]|8812|EIC) \(Form 1040\)"
+    r"|Form (?:8949|4868|8812|8829)\b"
+    r"|Sales and Other Dispositions of Capital Assets"
+)
+
+
+def is_relevant_page(text):
+    return RELEVANT_PAGE_PATTERN.search(text.translate(TEXTRACT_CHARACTERS)) is not None
+
+
+def page_has_text_layer(page, words=None, min_words=None):
+    """
+    A page is usable locally when its text layer has enough real words and is not mostly unmapped glyphs
+    """
+    min_words = min_words or config.TEXTRACT_SETTINGS.get("min_text_layer_words", 20)
+    words = page.get_text("words") if words is None else words
+    if len(words) < min_words:
+        return False
+    text = "".join(word[4] for word in words)
+    return text.count("�") <= len(text) * 0.05
+
+
+def page_elements(page, words=None):
+    """
+    Words (and filled form widgets) of one page as standalone elements with Textract-style normalized positions
+    """
+    width, height = page.rect.width, page.rect.height
+    words = page.get_text("words") if words is None else words
+    elements = []
+    for x0, y0, x1, y1, text, *_ in words:
+        if LEADER_PATTERN.match(text):
+            continue
+        elements.append({
+            'text': text.translate(TEXTRACT_CHARACTERS),
+            'type': 'WORD',
+            'top': y0 / height,
+            'left': x0 / width,
+            'height': (y1 - y0) / height
+        })
+
+    # Fillable PDFs keep entered values in widgets, not in the page text
+    for widget in page.widgets() or []:
+        rect = widget.rect
+        if widget.field_type in (fitz.PDF_WIDGET_TYPE_CHECKBOX, fitz.PDF_WIDGET_TYPE_RADIOBUTTON):
+            text = "[X]" if widget.field_value not in (None, False, "", "Off") else "[ ]"
+            element_type = 'SELECTION_ELEMENT'
+        elif widget.field_value:
+            text = str(widget.field_value)
+            element_type = 'WORD'
+        else:
+            continue
+        elements.append({
+            'text': text,
+            'type': element_type,
+            'top': rect.y0 / height,
+            'left': rect.x0 / width,
+            'height': (rect.y1 - rect.y0) / height
+        })
+    return elements
+
+
+def extract_text_layer(pdf_path, group_elements, relevant_only=False):
+    """
+    Build page content from the PDF text layer wherever it is usable
+    With relevant_only, pages whose text shows none of the mapped forms are dropped (unless that would drop them all)
+    Returns ({page_num: content items}, [page numbers that need OCR], [dropped page numbers]);
+    page numbers are 1-based like Textract's
+    """
+    local_pages = {}
+    ocr_pages = []
+    dropped_pages = []
+    with fitz.open(pdf_path) as doc:
+        for index, page in enumerate(doc):
+            page_num = index + 1
+            words = page.get_text("words")
+            if not page_has_text_layer(page, words):
+                # Nothing to classify on a scanned page, so it always goes to OCR
+                ocr_pages.append(page_num)
+                continue
+            if relevant_only and not is_relevant_page(" ".join(word[4] for word in words)):
+                dropped_pages.append((page_num, words))
+                continue
+            local_pages[page_num] = _page_content(page, words, group_elements)
+
+        if relevant_only and not local_pages and not ocr_pages:
+            print("⚠️ No page looked like a mapped form, keeping the whole document")
+            for page_num, words in dropped_pages:
+                local_pages[page_num] = _page_content(doc[page_num - 1], words, group_elements)
+            dropped_pages = []
+
+    return local_pages, ocr_pages, [page_num for page_num, _ in dropped_pages]
+
+
+def _page_content(page, words, group_elements):
+    lines = group_elements(page_elements(page, words))
+    return [
+        {'type': 'text_line', 'content': line['content'], 'position': line['position']}
+        for line in lines
+    ]
+
+
+def select_relevant_pages(pdf_path):
+    """
+    1-based page numbers worth sending to Textract: pages showing a mapped form, plus every page without a
+    text layer since those cannot be classified locally. Falls back to all pages if nothing matches.
+    """
+    relevant = []
+    with fitz.open(pdf_path) as doc:
+        for index, page in enumerate(doc):
+            words = page.get_text("words")
+            if not page_has_text_layer(page, words) or is_relevant_page(" ".join(word[4] for word in words)):
+                relevant.append(index + 1)
+        return relevant or list(range(1, doc.page_count + 1)), doc.page_count
+
+
+def write_page_subset(pdf_path, page_numbers, output_path=None):
+    """
+    Write the given 1-based pages of pdf_path into a new PDF
+    Returns (path, is_temporary); when every page is selected the original file is returned untouched
+    so its Textract cache entry (keyed by the file's hash) still applies
+    """
+    with fitz.open(pdf_path) as doc:
+        if list(page_numbers) == list(range(1, doc.page_count + 1)):
+            return pdf_path, False
+        if output_path is None:
+            base, _ = os.path.splitext(pdf_path)
+            output_path = f"{base}_pages_{uuid.uuid4().hex[:8]}.pdf"
+        doc.select([n - 1 for n in page_numbers])
+        doc.save(output_path, garbage=3, deflate=True, no_new_id=True)
+    return output_path, True
@@ -8,6 +8,7 @@ from langchain.document_loaders import TextLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import Document
 from src import config
+from src.llm_cache import get_llm_cache
 import json
 import os
 
@@ -23,23 +24,12 @@ def generate_recommendations(json_file,session_id):
             data = json.load(f)
     else:
         data=json_file
+    if isinstance(data, dict):
+        # Extraction confidences and sources are for the UI, not the advisor prompt
+        data = {key: value for key, value in data.items() if key not in ("field_confidence", "field_source")}
     json_text = json.dumps(data, indent=2)
-    docs = [Document(page_content=json_text)]
-
-    # === Split Text into Chunks ===
-    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-    chunks = splitter.split_documents(docs)
-
-    # === Embedding + Vector Store ===
-    embedder = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    vectorstore = FAISS.from_documents(chunks, embedder)
-
-    # === LLM via Groq ===
-    llm = ChatGroq(
-        temperature=0.3,
-        model_name="llama3-8b-8192",
-        groq_api_key="s"
-    )
+    model = "llama3-8b-8192"
+    temperature = 0.3
 
     # === Prompt Template with Description + Instructions ===
     prompt_template = PromptTemplate.from_template("""
@@ -92,28 +82,54 @@ def generate_recommendations(json_file,session_id):
         {question}
         """)
 
-    # === Retrieval-based Chain ===
-    qa_chain = RetrievalQA.from_chain_type(
-        llm=llm,
-        retriever=vectorstore.as_retriever(search_kwargs={"k": 4}),
-        chain_type="stuff",
-        chain_type_kwargs={"prompt": prompt_template},
-        return_source_documents=False,
-    )
-
     # === Request Model ===
     query = (
         "Analyze ALL aspects of the user's tax data comprehensively and provide optimization strategies in JSON format. "
         "Provide at least 3 'needs_attention' items and 4 'opportunities' based on actual tax details."
     )
 
-    print("🔍 Running analysis...\n")
+    # Identical taxpayer data + prompt always produce the same retrieval context, so the response is cacheable
+    llm_cache = get_llm_cache()
+    cache_key = llm_cache.make_key(model, f"{prompt_template.template}\n{json_text}\n{query}", temperature)
+    response = llm_cache.get(cache_key)
+    from_cache = response is not None
+
+    if not from_cache:
+        docs = [Document(page_content=json_text)]
+
+        # === Split Text into Chunks ===
+        splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
+        chunks = splitter.split_documents(docs)
+
+        # === Embedding + Vector Store ===
+        embedder = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+        vectorstore = FAISS.from_documents(chunks, embedder)
+
+        # === LLM via Groq ===
+        llm = ChatGroq(
+            temperature=temperature,
+            model_name=model,
+            groq_api_key="s"
+        )
+
+        # === Retrieval-based Chain ===
+        qa_chain = RetrievalQA.from_chain_type(
+            llm=llm,
+            retriever=vectorstore.as_retriever(search_kwargs={"k": 4}),
+            chain_type="stuff",
+            chain_type_kwargs={"prompt": prompt_template},
+            return_source_documents=False,
+        )
+
+        print("🔍 Running analysis...\n")
 
-    response = qa_chain.run(query)
+        response = qa_chain.run(query)
 
     try:
         # Try parsing response text
         parsed = json.loads(response)
+        if not from_cache:
+            llm_cache.set(cache_key, model, response)
         
         # Print nicely
         # print(json.dumps(parsed, indent=2, ensure_ascii=False))
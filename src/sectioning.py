@@ -0,0 +1,306 @@
+import re
+import time
+import regex
+from bisect import bisect_right
+from collections import defaultdict
+from src.pattern_registry import registry
+
+year_pattern_schedules = r"\(Form 1040\)\s*\d{4}"
+year_pattern_forms = r"\(\d{4}\)"
+
+# Section key -> (start marker, end pattern). A section runs from the first start marker
+# to the end of the last end-pattern match, as extract_by_headers() used to slice it
+HEADER_SECTIONS = [
+    ("schedule_a", "SCHEDULE A", f"Schedule A {year_pattern_schedules}"),
+    ("schedule_b", "SCHEDULE B", f"Schedule B {year_pattern_schedules}"),
+    ("schedule_c", "SCHEDULE C", f"Schedule C {year_pattern_schedules}"),
+    ("schedule_d", "SCHEDULE D", f"Schedule D {year_pattern_schedules}"),
+    ("schedule_e", "SCHEDULE E", f"Schedule E {year_pattern_schedules}"),
+    ("schedule_f", "SCHEDULE F", f"Schedule F {year_pattern_schedules}"),
+    ("schedule_h", "SCHEDULE H", f"Schedule H {year_pattern_schedules}"),
+    ("schedule_j", "SCHEDULE J", f"Schedule J {year_pattern_schedules}"),
+    ("schedule_r", "SCHEDULE R", f"Schedule R {year_pattern_schedules}"),
+    ("schedule_se", "SCHEDULE SE", f"Schedule SE {year_pattern_schedules}"),
+    ("schedule_1", "SCHEDULE 1", f"Schedule 1 {year_pattern_schedules}"),
+    ("schedule_2", "SCHEDULE 2", f"Schedule 2 {year_pattern_schedules}"),
+    ("schedule_3", "SCHEDULE 3", f"Schedule 3 {year_pattern_schedules}"),
+    ("form_8949", "Form Sales and Other Dispositions of Capital Assets", r"Form 8949 \(\d{4}\)|Form: 8949 \(\d{4}\)"),
+    ("form_4868", "Form 4868", f"Form 4868 {year_pattern_forms}"),
+    ("form_8812", "Form 8812", f"Form 8812 {year_pattern_forms}"),
+    ("form_8829", "Form 8829", f"Form 8829 {year_pattern_forms}"),
+    ("schedule_eic", "Schedule EIC", f"Schedule EIC {year_pattern_schedules}"),
+    ("sign_here", "Sign Under penalties of perjury", "Spouse's occupation"),
+    ("paid_preparer", "Preparer's signature", "Firm's EIN"),
+]
+
+# Form 1040 sections: alternatives tried in order, each a head pattern followed by tail steps.
+# Every step is the first match after the previous one ("after" keeps the match, "before" stops at it),
+# which is what the old `head.*?tail` DOTALL searches matched
+MAIN_SECTIONS = {
+    "basic_info": [
+        (r'Your first name and middle initial ', [(r'1a\s+', "before")]),
+        (r'U.S. Individual Income Tax Return', [(r'1a\s+', "before")]),
+    ],
+    "income": [
+        (r'TABLE:\sIncome \| 1a \| Total amount from Form', [(r'Form 1040', "after")]),
+        (r'(?:1[az]|W-2)', [(r'15\s+[\d,\-]+', "after")]),
+    ],
+    "tax": [
+        (r'TABLE:\sTax and\s*\|', [(r'total tax[\|\s\d\,]+', "after")]),
+        (r'Tax and\s+16', [(r'24\s+[\d,\-]+', "after")]),
+    ],
+    "payments": [
+        (r'(?:Payments\s*\|)?\s*25\s*\|', [(r'37\s*\|', "after"), (r'38\s*\|', "before")]),
+        (r'Payments\s+25', [(r'37\s+[\d,\-]+', "after")]),
+    ],
+}
+
+
+# Form each section lives on; sections are searched only within that form's pages when they can be found
+SECTION_FORMS = {
+    "basic_info": "form_1040",
+    "income": "form_1040",
+    "tax": "form_1040",
+    "payments": "form_1040",
+    "sign_here": "form_1040",
+    "paid_preparer": "form_1040",
+    **{section_key: section_key for section_key, _, _ in HEADER_SECTIONS if section_key not in ("sign_here", "paid_preparer")},
+}
+
+# Fallbacks when a pattern runs out of time: the literal-led patterns (page markers, form titles, anchors,
+# section heads and footers) are rerun on the stdlib engine, and each step that ends a main section is searched
+# only within SECTION_WINDOW_CHARS of the previous match
+SECTION_WINDOW_CHARS = 20000
+
+PAGE_MARKER_PATTERN = registry.register(
+    "page_marker", r"^=== PAGE (\d+) ===$", regex.MULTILINE, fallback_plain=True
+)
+
+# Identifies the form a page belongs to from the first lines after its marker; the leftmost hit wins,
+# so "Schedule D (Form 1040)" is Schedule D while "Form 1040 (2024)" is the 1040 itself
+# A title line such as "8959 Additional Medicare Tax" names the form too; "Attach to Form 1040" does not
+PAGE_FORM_PATTERN = registry.register(
+    "page_form",
+    r"\bschedule:?\s+(?P<schedule>SE|EIC|8812|[123ABCDEFHJR])\b"
+    r"|(?<!to )\bform:?\s+(?P<form>\d{3,4})\b"
+    r"|^(?!19\d\d|20[0-4]\d)(?P<title_form>\d{4}) (?=[A-Z][a-z])",
+    regex.IGNORECASE | regex.MULTILINE,
+    fallback_plain=True
+)
+PAGE_HEAD_LINES = 6
+
+
+def _anchor_key(pattern):
+    # Lead word plus the two literal characters after it, e.g. ("Schedule", " A") or ("Form", ": ")
+    lead = re.match(r"[A-Za-z']+", pattern).group(0)
+    return lead, pattern[len(lead):len(lead) + 2]
+
+
+# Anchor key -> start markers and compiled end patterns that can begin there
+_START_MARKERS = defaultdict(list)
+_END_PATTERNS = defaultdict(list)
+for _key, _start, _end_pattern in HEADER_SECTIONS:
+    _START_MARKERS[_anchor_key(_start)].append((_key, _start))
+    for _index, _alternative in enumerate(_end_pattern.split("|")):
+        _END_PATTERNS[_anchor_key(_alternative)].append(
+            (_key, registry.register(f"{_key}:end:{_index}", _alternative, fallback_plain=True))
+        )
+
+# Every start marker and end pattern begins with one of these lead words, so one scan for them finds
+# every position where a header or footer can start; the two following characters pick the candidates
+ANCHOR_PATTERN = registry.register("section_anchor", "(?P<lead>{})(?=(?P<next>.{{0,2}}))".format(
+    "|".join(sorted({lead for lead, _ in list(_START_MARKERS) + list(_END_PATTERNS)}, key=len, reverse=True))
+), regex.DOTALL, fallback_plain=True)
+
+_MAIN_SECTION_PATTERNS = {
+    section_key: [
+        (
+            registry.register(f"{section_key}:{index}:head", head, fallback_plain=True),
+            [
+                (
+                    registry.register(
+                        f"{section_key}:{index}:step{step_index}", step, fallback_window=SECTION_WINDOW_CHARS
+                    ),
+                    mode
+                )
+                for step_index, (step, mode) in enumerate(steps)
+            ]
+        )
+        for index, (head, steps) in enumerate(alternatives)
+    ]
+    for section_key, alternatives in MAIN_SECTIONS.items()
+}
+
+
+def page_marker_index(text):
+    """
+    Offsets of the "=== PAGE N ===" markers in formatted text, with their page numbers
+    """
+    page_offsets, page_nums = [], []
+    for match in PAGE_MARKER_PATTERN.finditer(text):
+        page_offsets.append(match.start())
+        page_nums.append(int(match.group(1)))
+    return page_offsets, page_nums
+
+
+def page_at(page_offsets, page_nums, offset):
+    """
+    Page number an offset falls on, or None before the first page marker
+    """
+    position = bisect_right(page_offsets, offset) - 1
+    return page_nums[position] if position >= 0 else None
+
+
+def _page_form(text, start, end):
+    head_end = start
+    for _ in range(PAGE_HEAD_LINES + 1):
+        head_end = text.find("\n", head_end + 1, end)
+        if head_end == -1:
+            head_end = end
+            break
+    match = PAGE_FORM_PATTERN.search(text, start, head_end)
+    if not match:
+        return None
+    if match.group("schedule"):
+        schedule = match.group("schedule").lower()
+        return "form_8812" if schedule == "8812" else f"schedule_{schedule}"
+    return f"form_{match.group('form') or match.group('title_form')}"
+
+
+def build_page_index(text):
+    """
+    One entry per page marker: (page number, start offset, end offset, form key or None)
+    """
+    page_offsets, page_nums = page_marker_index(text)
+    page_ends = page_offsets[1:] + [len(text)]
+    return [
+        (page_num, start, end, _page_form(text, start, end))
+        for page_num, start, end in zip(page_nums, page_offsets, page_ends)
+    ]
+
+
+def form_spans(page_index):
+    """
+    Form key -> (start, end) of the first run of pages belonging to that form
+    Unrecognised pages stay with the form before them; a later copy of a form (e.g. a state schedule
+    with the same letter) does not stretch the span across everything in between
+    """
+    spans = {}
+    current_form = None
+    for _, start, end, form in page_index:
+        if form is not None and form != current_form:
+            current_form = form if form not in spans else None
+            if current_form is not None:
+                spans[current_form] = (start, end)
+        elif current_form is not None:
+            spans[current_form] = (spans[current_form][0], end)
+    return spans
+
+
+def build_header_index(text):
+    """
+    One pass over the text: first start-marker offset and last end-match span per header section
+    """
+    starts = {}
+    ends = {}
+    for anchor in ANCHOR_PATTERN.finditer(text):
+        anchor_key = anchor.group("lead", "next")
+        if anchor_key not in _START_MARKERS and anchor_key not in _END_PATTERNS:
+            continue
+        position = anchor.start()
+        for section_key, start in _START_MARKERS.get(anchor_key, ()):
+            if section_key not in starts and text.startswith(start, position):
+                starts[section_key] = position
+        for section_key, end_pattern in _END_PATTERNS.get(anchor_key, ()):
+            # Same non-overlapping matches re.findall() would return
+            if section_key in ends and position < ends[section_key][1]:
+                continue
+            match = end_pattern.match(text, position)
+            if match:
+                ends[section_key] = match.span()
+    return starts, ends
+
+
+def _main_section(text, alternatives):
+    for head, steps in alternatives:
+        match = head.search(text)
+        if not match:
+            continue
+        section_end = match.end()
+        for step, mode in steps:
+            step_match = step.search(text, section_end)
+            if not step_match:
+                break
+            section_end = step_match.end() if mode == "after" else step_match.start()
+        else:
+            return text[match.start():section_end]
+        # Later heads can only end later, so if this one has no tail none of them has
+    return ""
+
+
+def _slice_sections(text, section_keys):
+    starts, ends = build_header_index(text)
+    sections = {}
+    for section_key in section_keys:
+        if section_key in _MAIN_SECTION_PATTERNS:
+            sections[section_key] = _main_section(text, _MAIN_SECTION_PATTERNS[section_key])
+        elif section_key in starts and section_key in ends:
+            sections[section_key] = text[starts[section_key]:ends[section_key][1]]
+        else:
+            sections[section_key] = ""
+    return sections
+
+
+# Every section key, in the order sections are returned
+SECTION_KEYS = list(MAIN_SECTIONS) + [section_key for section_key, _, _ in HEADER_SECTIONS]
+
+
+def extract_sections(text, page_aware=True, section_keys=None):
+    """
+    Slice the formatted text into the Form 1040 sections and attached schedules / forms
+    With page_aware, each section is searched only within the pages of its form; sections whose form has no
+    recognised pages, or that come out empty there, fall back to the whole document.
+    section_keys restricts the search to some sections (default: all of SECTION_KEYS).
+    Returns (sections, timings in seconds)
+    """
+    started = time.perf_counter()
+    section_keys = list(section_keys) if section_keys is not None else SECTION_KEYS
+    unknown_keys = [section_key for section_key in section_keys if section_key not in SECTION_FORMS]
+    if unknown_keys:
+        raise ValueError(f"Unknown section keys: {unknown_keys}")
+    sections = {}
+    spans = form_spans(build_page_index(text)) if page_aware else {}
+    indexed = time.perf_counter()
+
+    forms = defaultdict(list)
+    for section_key in section_keys:
+        forms[spans.get(SECTION_FORMS[section_key])].append(section_key)
+    for span, form_section_keys in forms.items():
+        if span is not None:
+            start, end = span
+            sections.update(
+                (section_key, section_text)
+                for section_key, section_text in _slice_sections(text[start:end], form_section_keys).items()
+                if section_text
+            )
+
+    fallback_keys = [section_key for section_key in section_keys if section_key not in sections]
+    if fallback_keys:
+        sections.update(_slice_sections(text, fallback_keys))
+    finished = time.perf_counter()
+
+    timings = {
+        "pages": indexed - started,
+        "slice": finished - indexed,
+        "fallback_sections": len(fallback_keys),
+        "total": finished - started
+    }
+    return {section_key: sections[section_key] for section_key in section_keys}, timings
+
+
+def extract_sections_batch(texts, page_aware=True, section_keys=None):
+    """
+    Section many documents with the same compiled patterns, e.g. when reprocessing saved text files
+    Returns one (sections, timings) pair per text, in input order
+    """
+    return [extract_sections(text, page_aware, section_keys) for text in texts]
@@ -0,0 +1,123 @@
+import re
+
+# A form line reference such as 9, 1z, 25d or 35a
+LINE_NUMBER = r"\d{1,2}[a-z]?"
+# A dollar amount: optional sign / $ / parentheses, comma-grouped or plain digits, optional cents; -0- is zero
+AMOUNT = r"-0-|\(?-?\$?\s?(?:\d{1,3}(?:,\d{3})+|\d+)(?:\.\d+)?\)?"
+
+LINE_NUMBER_PATTERN = re.compile(rf"^{LINE_NUMBER}$")
+AMOUNT_PATTERN = re.compile(rf"^(?:{AMOUNT})$")
+# Words before a number that make it a cross reference ("from Schedule 1, line 26 10"), not a line number column
+REFERENCE_WORDS = ("line", "lines")
+
+
+def parse_amount(text):
+    """
+    Dollar amount as int (or float when it has cents); parentheses and leading minus signs are negative
+    Returns None when the text is not an amount
+    """
+    text = text.strip()
+    if not AMOUNT_PATTERN.match(text):
+        return None
+    if text == "-0-":
+        return 0
+    negative = text.startswith("(") and text.endswith(")") or "-" in text
+    digits = text.strip("()").replace("-", "").replace("$", "").replace(",", "").strip()
+    value = float(digits) if "." in digits else int(digits)
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return -value if negative else value
+
+
+def _labels_line(words, line_number):
+    # The row's label names the line too: "25a" itself, or just its letter ("a Form(s) W-2 ... 25a")
+    suffix = line_number.lstrip("0123456789")
+    return line_number in words or (suffix and suffix in words)
+
+
+def _table_row_values(row):
+    # "label | ... | <line> | <amount>": a value is the cell right after a line number cell.
+    # A row whose label repeats in a right-hand line number cell with nothing after it was left blank
+    cells = [cell.strip() for cell in row.split("|")]
+    filled = [index for index, cell in enumerate(cells) if cell]
+    if len(filled) < 2:
+        return []
+    last = filled[-1]
+    found = []
+    for index in filled[:-1]:
+        line_number, value_cell = cells[index], cells[index + 1]
+        if not LINE_NUMBER_PATTERN.match(line_number):
+            continue
+        # A small bare number could be another line number; only trust it as the row's final value
+        if LINE_NUMBER_PATTERN.match(value_cell) and index + 1 != last:
+            continue
+        amount = parse_amount(value_cell)
+        if amount is not None:
+            found.append((line_number, amount))
+    line_number = cells[last]
+    if (
+        not found and last < len(cells) - 1 and LINE_NUMBER_PATTERN.match(line_number)
+        and _labels_line(cells[:last], line_number)
+    ):
+        found.append((line_number, 0))
+    return found
+
+
+def _text_line_values(line):
+    # Plain text line ending in the line number entered again in the right-hand column, then the amount:
+    # "24 Add lines 22 and 23. This is your total tax 24 33,359". Try "<line> <amount>" first, then a bare
+    # trailing line number ("21 Add lines 19 and 20 21") for a line left blank
+    words = line.split()
+    for position, amount in ((len(words) - 2, words[-1]), (len(words) - 1, None)):
+        if position < 1:
+            continue
+        line_number = words[position].rstrip(":")
+        if not LINE_NUMBER_PATTERN.match(line_number) or words[position - 1] in REFERENCE_WORDS:
+            continue
+        value = parse_amount(amount) if amount is not None else 0
+        if value is not None and _labels_line(words[:position], line_number):
+            return [(line_number, value)]
+    return []
+
+
+def line_values(section_text, sources=None):
+    """
+    Form line number -> amount for every row that states both, first occurrence wins
+    Reads table rows (the value after a line number cell) and plain text lines that end in
+    "<line number> <amount>"; line numbers are never returned as values, and a line that repeats its
+    number with no amount after it reads as 0. A sources dict receives the text line each value came from.
+    """
+    values = {}
+    for line in section_text.splitlines():
+        stripped = line.strip()
+        if not stripped or stripped == "TABLE:":
+            continue
+        # Sections can start part-way through a table, so rows are recognised by their pipes
+        found = _table_row_values(stripped) if "|" in stripped else _text_line_values(stripped)
+        for line_number, amount in found:
+            if line_number not in values:
+                values[line_number] = amount
+                if sources is not None:
+                    sources[line_number] = stripped
+    return values
+
+
+def resolve_fields(section_text, field_lines, sources=None):
+    """
+    Fields filled straight from the section's rows; field_lines maps a field to its candidate line numbers
+    in order of preference. Fields without a matching row are left out for the LLM to resolve.
+    A sources dict receives, per resolved field, the list of text lines its value was read from.
+    """
+    if not field_lines or not section_text:
+        return {}
+    line_sources = {}
+    values = line_values(section_text, line_sources)
+    resolved = {}
+    for field, line_numbers in field_lines.items():
+        for line_number in line_numbers:
+            if line_number in values:
+                resolved[field] = values[line_number]
+                if sources is not None:
+                    sources[field] = [line_sources[line_number]]
+                break
+    return resolved
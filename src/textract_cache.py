@@ -0,0 +1,85 @@
+import os
+import json
+import hashlib
+from src import config
+
+textract_cache_path = config.PATHS.get("textract_cache_path", "")
+os.makedirs(textract_cache_path, exist_ok=True)
+
+
+def file_sha256(file_path, chunk_size=1024 * 1024):
+    """
+    Content hash of a local file, used as the cache key for its Textract output
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _cache_file(content_hash, feature_types):
+    # Different FeatureTypes give different block sets for the same bytes
+    features = "-".join(sorted(feature_types)).lower() or "text"
+    return os.path.join(textract_cache_path, f"{content_hash}_{features}.json")
+
+
+def load_blocks(content_hash, feature_types):
+    """
+    Return the cached Textract blocks for this content hash, or None if the document was never analysed
+    """
+    cache_file = _cache_file(content_hash, feature_types)
+    if not os.path.exists(cache_file):
+        return None
+    try:
+        with open(cache_file, "r", encoding="utf-8") as f:
+            return json.load(f)["Blocks"]
+    except (OSError, ValueError, KeyError) as e:
+        print(f"⚠️ Ignoring unreadable Textract cache entry {cache_file}: {e}")
+        return None
+
+
+def save_blocks(content_hash, feature_types, blocks):
+    cache_file = _cache_file(content_hash, feature_types)
+    # Write to a temp file first so a crash never leaves a truncated cache entry behind
+    tmp_file = f"{cache_file}.tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump({"FeatureTypes": sorted(feature_types), "Blocks": blocks}, f)
+    os.replace(tmp_file, cache_file)
+    return cache_file
+
+
+class BlockCacheWriter:
+    """
+    Streams blocks into a cache entry one at a time, so callers that process pages incrementally
+    never have to hold the whole document in memory just to cache it
+    The entry only becomes visible on a clean exit; an exception discards the partial file
+    """
+
+    def __init__(self, content_hash, feature_types):
+        self.feature_types = sorted(feature_types)
+        self.cache_file = _cache_file(content_hash, feature_types)
+        self.tmp_file = f"{self.cache_file}.tmp"
+        self._file = None
+        self._count = 0
+
+    def __enter__(self):
+        self._file = open(self.tmp_file, "w", encoding="utf-8")
+        self._file.write(f'{{"FeatureTypes": {json.dumps(self.feature_types)}, "Blocks": [')
+        return self
+
+    def write(self, block):
+        if self._count:
+            self._file.write(", ")
+        json.dump(block, self._file)
+        self._count += 1
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self._file.write("]}")
+        self._file.close()
+        if exc_type is None:
+            os.replace(self.tmp_file, self.cache_file)
+        else:
+            os.remove(self.tmp_file)
+        return False
@@ -0,0 +1,144 @@
+import time
+import uuid
+import queue
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from pypdf import PdfReader
+from src import config
+
+TERMINAL_STATUSES = {"SUCCEEDED", "FAILED", "PARTIAL_SUCCESS"}
+# Textract's SNS completion messages report a failed job as ERROR rather than the API's FAILED
+NOTIFICATION_STATUSES = {"ERROR": "FAILED"}
+
+
+def pdf_page_count(pdf_path):
+    """
+    Cheap local page count used to size the first poll interval; None if the PDF cannot be read
+    """
+    try:
+        return len(PdfReader(pdf_path).pages)
+    except Exception as e:
+        print(f"⚠️ Could not count pages of {pdf_path}: {e}")
+        return None
+
+
+def poll_delays(page_count=None, max_delay=None, factor=1.5):
+    """
+    Adaptive backoff: small documents usually finish within a couple of seconds, so start with short polls
+    and grow the interval geometrically up to max_delay for long-running jobs
+    """
+    max_delay = max_delay or config.TEXTRACT_SETTINGS.get("max_poll_delay", 5.0)
+    if page_count is None:
+        delay = 1.0
+    elif page_count <= 5:
+        delay = 0.5
+    elif page_count <= 25:
+        delay = 1.0
+    else:
+        delay = 2.0
+    while True:
+        yield min(delay, max_delay)
+        delay *= factor
+
+
+def make_s3_object_name(session_id, content_hash):
+    # Unique per job so concurrent sessions (or re-runs of the same file) never overwrite each other's input
+    return f"textract-input/{session_id}/{content_hash[:16]}_{uuid.uuid4().hex[:8]}.pdf"
+
+
+def run_sync(coro):
+    """
+    Run a coroutine from synchronous code, even when the calling thread already has a running event loop
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        return pool.submit(asyncio.run, coro).result()
+
+
+class LocalNotificationChannel:
+    """
+    In-process stand-in for the SNS topic / SQS queue Textract publishes job completion messages to
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+
+    def publish(self, job_id, status):
+        self._queue.put({"JobId": job_id, "Status": status})
+
+    def receive(self, timeout=None):
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class TextractJobOrchestrator:
+    """
+    Tracks any number of outstanding Textract JobIds from one event loop.
+    Each job is polled with adaptive backoff; when a notification channel is configured, a completion
+    message for the job ends its wait immediately and polling only acts as a safety net.
+    """
+
+    def __init__(self, textract, notification_channel=None, max_poll_delay=None):
+        self.textract = textract
+        self.notification_channel = notification_channel
+        self.max_poll_delay = max_poll_delay
+        self._waiters = {}
+
+    def _job_status(self, job_id):
+        # MaxResults=1 keeps status polls from downloading a full page of blocks
+        return self.textract.get_document_analysis(JobId=job_id, MaxResults=1)["JobStatus"]
+
+    async def _dispatch_notifications(self):
+        while True:
+            message = await asyncio.to_thread(self.notification_channel.receive, 0.5)
+            if not message:
+                continue
+            status = NOTIFICATION_STATUSES.get(message.get("Status"), message.get("Status"))
+            waiter = self._waiters.get(message.get("JobId"))
+            # A waiter resolves once, so anything short of a final status would end every later backoff delay
+            if waiter and not waiter.done() and status in TERMINAL_STATUSES:
+                waiter.set_result(status)
+
+    async def _wait_for_job(self, job_id, page_count=None):
+        waiter = self._waiters[job_id]
+        started = time.monotonic()
+        for delay in poll_delays(page_count, self.max_poll_delay):
+            status = await asyncio.to_thread(self._job_status, job_id)
+            if status in TERMINAL_STATUSES:
+                break
+            try:
+                status = await asyncio.wait_for(asyncio.shield(waiter), timeout=delay)
+                if status in TERMINAL_STATUSES:
+                    break
+            except asyncio.TimeoutError:
+                pass
+        print(f"Textract job {job_id} finished with {status} after {time.monotonic() - started:.1f}s")
+        return status
+
+    async def wait_for_jobs(self, jobs):
+        """
+        Wait for every job in {job_id: page_count or None} and return {job_id: final status}
+        """
+        loop = asyncio.get_running_loop()
+        self._waiters = {job_id: loop.create_future() for job_id in jobs}
+        dispatcher = asyncio.create_task(self._dispatch_notifications()) if self.notification_channel else None
+        try:
+            statuses = await asyncio.gather(
+                *(self._wait_for_job(job_id, page_count) for job_id, page_count in jobs.items())
+            )
+        finally:
+            if dispatcher:
+                dispatcher.cancel()
+            self._waiters = {}
+        return dict(zip(jobs, statuses))
+
+    def wait(self, job_id, page_count=None):
+        """
+        Blocking convenience wrapper for a single job
+        """
+        return run_sync(self.wait_for_jobs({job_id: page_count}))[job_id]
@@ -0,0 +1,38 @@
+import threading
+import tiktoken
+from src import config
+
+# Rough characters per token, used only when the tiktoken encoding cannot be loaded
+CHARS_PER_TOKEN = 4
+
+_encoding = None
+_encoding_unavailable = False
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding():
+    global _encoding, _encoding_unavailable
+    if _encoding is None and not _encoding_unavailable:
+        with _encoding_lock:
+            if _encoding is None and not _encoding_unavailable:
+                name = config.LLM_SETTINGS.get("token_encoding", "cl100k_base")
+                try:
+                    _encoding = tiktoken.get_encoding(name)
+                except Exception as e:
+                    # tiktoken downloads the BPE file on first use; offline hosts fall back to an estimate
+                    print(f"⚠️ Could not load tiktoken encoding {name}, estimating tokens from length: {e}")
+                    _encoding_unavailable = True
+    return _encoding
+
+
+def count_tokens(text):
+    """
+    Prompt tokens for a piece of text with the configured tiktoken encoding
+    cl100k_base is not the Llama 3 tokenizer but counts within a few percent of it, which is all budgeting needs
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
@@ -2,34 +2,20 @@ import os
 from llama_index.core import Settings, VectorStoreIndex, Document
 from llama_index.llms.groq import Groq
 from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-import re
 import json
-from src import config
+from src import config, sectioning
 
-def extract_sections_from_text(text:str ,save_path:str) -> dict:
-    def extract_by_headers(start: str, end_pattern: str) -> str:
-        end_matches = re.findall(end_pattern, text)
-        if start in text and end_matches:
-            end_text = end_matches[-1]
-            return text[text.find(start):text.rfind(end_text) + len(end_text)]
-        return ""
-
-    def extract_match_or_empty(pattern: str) -> str:
-        match = re.search(pattern, text, re.DOTALL)
-        return match.group(0).strip() if match else ""
+# Sections indexed for chat; sliced by the same compiled definitions field_mapping uses
+VECTOR_SECTION_KEYS = [
+    "basic_info", "income", "tax", "payments", "schedule_a", "schedule_b", "schedule_d", "schedule_1"
+]
 
-    year_pattern = r"\(Form 1040\)\s*\d{4}"
-
-    sections = {
-        "basic_info": extract_match_or_empty(r'(?s)U.S. Individual Income Tax Return.*?(?=1a\s+)'),
-        "income": extract_match_or_empty(r'(?s)(?:1[az]|W-2).*?15\s+[\d,\-]+'),
-        "tax": extract_match_or_empty(r'(?s)Tax and\s+16.*?24\s+[\d,\-]+'),
-        "payments": extract_match_or_empty(r'(?s)Payments\s+25.*?37\s+[\d,\-]+'),
-        "schedule_a": extract_by_headers("SCHEDULE A", f"Schedule A {year_pattern}"),
-        "schedule_b": extract_by_headers("SCHEDULE B", f"Schedule B {year_pattern}"),
-        "schedule_d": extract_by_headers("SCHEDULE D", f"Schedule D {year_pattern}"),
-        "schedule_1": extract_by_headers("SCHEDULE 1", f"Schedule 1 {year_pattern}")
-    }
+def extract_sections_from_text(text:str ,save_path:str) -> dict:
+    sections, _ = sectioning.extract_sections(text, section_keys=VECTOR_SECTION_KEYS)
+    # Main sections are saved stripped, as before they were sliced by sectioning; schedules keep their spans
+    for section_key in sectioning.MAIN_SECTIONS:
+        if section_key in sections:
+            sections[section_key] = sections[section_key].strip()
 
     print("sectioned_data saving")
     os.makedirs(os.path.dirname(save_path), exist_ok=True)
@@ -0,0 +1,29 @@
+from src import compaction
+
+
+def test_repeated_text_lines_with_digits_are_kept():
+    text = "\n".join([
+        "Wages 50,000",
+        "Wages 50,000",
+        "Your social security number",
+        "Your social security number",
+    ])
+    assert compaction.compact_section(text).splitlines() == [
+        "Wages 50,000",
+        "Wages 50,000",
+        "Your social security number",
+    ]
+
+
+def test_repeated_table_markers_keep_tables_apart():
+    text = "\n".join([
+        "TABLE:",
+        "Name | Amount",
+        "ROBINHOOD | 9,254",
+        "TABLE:",
+        "Name | Amount",
+        "ROBINHOOD | 9,254",
+    ])
+    compacted = compaction.compact_section(text).splitlines()
+    assert compacted.count("TABLE:") == 2
+    assert compacted.count("ROBINHOOD | 9,254") == 2
@@ -0,0 +1,29 @@
+import os
+from src import sectioning
+
+SAMPLE_TEXT = os.path.join(
+    os.path.dirname(__file__), "..", "extracted_raw_data", "9d51c976273049e9972b57a880868fe7_text.txt"
+)
+
+
+def _sample_text():
+    with open(SAMPLE_TEXT, encoding="utf-8") as f:
+        return f.read()
+
+
+def test_page_aware_matches_flat_search():
+    text = _sample_text()
+    page_aware, _ = sectioning.extract_sections(text)
+    flat, _ = sectioning.extract_sections(text, page_aware=False)
+    assert page_aware == flat
+
+
+def test_misclassified_1040_page_falls_back_to_whole_document():
+    # Page 2 of the 1040 opening with another form's title cuts the 1040 span short after page 1
+    text = _sample_text().replace("=== PAGE 2 ===\n", "=== PAGE 2 ===\nForm 8888 Allocation of Refund\n", 1)
+    page_aware, timings = sectioning.extract_sections(text)
+    flat, _ = sectioning.extract_sections(text, page_aware=False)
+    for section_key in ("tax", "payments", "sign_here", "paid_preparer"):
+        assert page_aware[section_key]
+        assert page_aware[section_key] == flat[section_key]
+    assert timings["fallback_sections"] >= 4